@@ -16,7 +16,10 @@ from gi.repository import Gdk, Gio, GLib, Gtk
 
 import nino.shortcuts as shortcuts
 from nino.console import Console
+from nino.playback import programmer_levels
 from nino.settings import Settings, TabSettings
+from nino.show import levels_to_rows, load_show, save_show
+from nino.submasters import SUBMASTERS
 from nino.tab_device_controls import TabDeviceControls
 from nino.tab_patch import TabPatch
 from nino.window_live import LiveWindow
@@ -27,7 +30,8 @@ class Nino(Gtk.Application, Console):
     """niño is a Gtk application"""
 
     def __init__(self):
-        Console.__init__(self)
+        # Application settings, needed by console
+        Console.__init__(self, Settings.new())
         Gtk.Application.__init__(
             self,
             application_id="com.github.mikacousin.nino",
@@ -40,8 +44,6 @@ class Nino(Gtk.Application, Console):
         self.keystring = ""
         # About window
         self.about = None
-        # Application settings
-        self.settings = Settings.new()
 
         self.init_notebooks()
 
@@ -62,6 +64,7 @@ class Nino(Gtk.Application, Console):
         )
         # Create 2 windows
         self.create_main_windows()
+        self.start_journal()
 
     def do_startup(self):
         Gtk.Application.do_startup(self)
@@ -112,6 +115,11 @@ class Nino(Gtk.Application, Console):
             "about": ("_about", None),
             "settings": ("_settings", None),
             "quit": ("_exit", None),
+            "open": ("_open", None),
+            "save": ("_save", None),
+            "save_as": ("_save_as", None),
+            "record_output": ("_record_output", None),
+            "replay_output": ("_replay_output", None),
             "live": ("_live", None),
             "undo": ("_undo", None),
             "redo": ("_redo", None),
@@ -137,6 +145,13 @@ class Nino(Gtk.Application, Console):
             "output": ("_output", None),
             "offset": ("_offset", None),
             "insert": ("_insert", None),
+            "autopatch": ("_autopatch", None),
+            "effect": ("_effect", None),
+            "stop_effects": ("_stop_effects", None),
+            "go": ("_go", None),
+            "goto": ("_goto", None),
+            "record": ("_record", None),
+            "record_submaster": ("_record_submaster", None),
         }
         for name, func in actions.items():
             function = getattr(self, func[0], None)
@@ -236,17 +251,110 @@ class Nino(Gtk.Application, Console):
         dialog.destroy()
         self.about = None
 
+    def _open(self, _action, _parameter):
+        dialog = Gtk.FileChooserDialog(
+            title=_("Open show"),
+            transient_for=self.get_active_window(),
+            action=Gtk.FileChooserAction.OPEN,
+        )
+        dialog.add_buttons(
+            _("_Cancel"), Gtk.ResponseType.CANCEL, _("_Open"), Gtk.ResponseType.ACCEPT
+        )
+        if dialog.run() == Gtk.ResponseType.ACCEPT:
+            path = dialog.get_filename()
+            with self.journal.paused():
+                loaded = load_show(path)
+            if loaded:
+                self.set_show_path(path)
+        dialog.destroy()
+
+    def _save(self, action, parameter):
+        if self.show_path:
+            save_show(self.show_path)
+            self.set_show_path(self.show_path)
+        else:
+            self._save_as(action, parameter)
+
+    def _save_as(self, _action, _parameter):
+        dialog = Gtk.FileChooserDialog(
+            title=_("Save show"),
+            transient_for=self.get_active_window(),
+            action=Gtk.FileChooserAction.SAVE,
+        )
+        dialog.add_buttons(
+            _("_Cancel"), Gtk.ResponseType.CANCEL, _("_Save"), Gtk.ResponseType.ACCEPT
+        )
+        dialog.set_do_overwrite_confirmation(True)
+        if dialog.run() == Gtk.ResponseType.ACCEPT:
+            path = dialog.get_filename()
+            save_show(path)
+            self.set_show_path(path)
+        dialog.destroy()
+
+    def _record_output(self, _action, _parameter):
+        if self.dmx.recorder:
+            self.stop_recording()
+            return
+        path = self._recording_path(
+            _("Record DMX output"), Gtk.FileChooserAction.SAVE, _("_Record")
+        )
+        if path:
+            try:
+                self.start_recording(path)
+            except OSError as error:
+                print(f"Can't record {path}: {error}")
+
+    def _replay_output(self, _action, _parameter):
+        if self.player and self.player.is_alive():
+            self.stop_replay()
+            return
+        path = self._recording_path(
+            _("Replay DMX output"), Gtk.FileChooserAction.OPEN, _("_Replay")
+        )
+        if path:
+            self.start_replay(path)
+
+    def _recording_path(self, title, action, button):
+        """Ask for a DMX recording file
+
+        Args:
+            title (str): dialog title
+            action (Gtk.FileChooserAction): SAVE or OPEN
+            button (str): accept button label
+
+        Returns:
+            path or None if cancelled
+        """
+        dialog = Gtk.FileChooserDialog(
+            title=title, transient_for=self.get_active_window(), action=action
+        )
+        dialog.add_buttons(
+            _("_Cancel"), Gtk.ResponseType.CANCEL, button, Gtk.ResponseType.ACCEPT
+        )
+        dialog.set_do_overwrite_confirmation(True)
+        path = None
+        if dialog.run() == Gtk.ResponseType.ACCEPT:
+            path = dialog.get_filename()
+        dialog.destroy()
+        return path
+
     def _exit(self, _action, _parameter):
         self.console_exit()
         self.quit()
 
     def _undo(self, _action, _parameter):
         if self.undo_manager.can_undo():
-            self.undo_manager.undo()
+            channels = self.patch.channels
+            with self.journal.paused():
+                self.undo_manager.undo()
+            self.journal.channels(self.patch.channels.diff(channels))
 
     def _redo(self, _action, _parameter):
         if self.undo_manager.can_redo():
-            self.undo_manager.redo()
+            channels = self.patch.channels
+            with self.journal.paused():
+                self.undo_manager.redo()
+            self.journal.channels(self.patch.channels.diff(channels))
 
     def _clear(self, _action, _parameter):
         self.statusbar_remove_all()
@@ -283,6 +391,53 @@ class Nino(Gtk.Application, Console):
     def _offset(self, _action, _parameter):
         self.send("offset")
 
+    def _autopatch(self, _action, _parameter):
+        self.send("autopatch")
+
+    def _effect(self, _action, _parameter):
+        self.send("effect")
+
+    def _stop_effects(self, _action, _parameter):
+        self.effects.stop_all()
+
+    def _go(self, _action, _parameter):
+        self.cue_list.go_next()
+
+    def _goto(self, _action, _parameter):
+        try:
+            number = float(self.keystring)
+        except ValueError:
+            number = None
+        if number is not None:
+            self.cue_list.goto_number(number)
+        self.statusbar_remove_all()
+
+    def _record(self, _action, _parameter):
+        if self.keystring:
+            try:
+                number = float(self.keystring)
+            except ValueError:
+                self.statusbar_remove_all()
+                return
+        elif self.cue_list.cues:
+            number = float(int(self.cue_list.cues[-1].number) + 1)
+        else:
+            number = 1.0
+        levels = programmer_levels()
+        self.journal.append(["cue", number, levels_to_rows(levels)])
+        self.cue_list.record(number, levels)
+        self.playback.cue_list_view.update_view()
+        self.statusbar_remove_all()
+
+    def _record_submaster(self, _action, _parameter):
+        if self.keystring.isdigit() and 0 < int(self.keystring) <= SUBMASTERS:
+            index = int(self.keystring) - 1
+            inhibitive = self.submasters.bank[index].inhibitive
+            look = programmer_levels()
+            self.journal.append(["submaster", index, inhibitive, levels_to_rows(look)])
+            self.submasters.record(index, look, inhibitive)
+        self.statusbar_remove_all()
+
     def send(self, signal):
         """Send signal to the right place
 
@@ -297,10 +452,16 @@ class Nino(Gtk.Application, Console):
         else:
             print("Another window")
 
-    def statusbar_push(self):
-        """Push keystring to StatusBars"""
-        self.live.statusbar.push(self.playback.context_id, self.keystring)
-        self.playback.statusbar.push(self.playback.context_id, self.keystring)
+    def statusbar_push(self, text=None):
+        """Push keystring to StatusBars
+
+        Args:
+            text (str): message to display instead of keystring
+        """
+        if text is None:
+            text = self.keystring
+        self.live.statusbar.push(self.playback.context_id, text)
+        self.playback.statusbar.push(self.playback.context_id, text)
 
     def statusbar_remove_all(self):
         """Empty StatusBars"""
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Automatic patch.
+
+Free addresses are read from the patch occupancy index as runs of
+consecutive free addresses, one list per universe, so a device never crosses
+a universe boundary. Devices are then placed in runs with one strategy:
+
+    first-fit   first run large enough, in universes and addresses order
+    best-fit    smallest run large enough, keeps large runs for large devices
+    grouped     devices with the same fixture are kept together in one run,
+                largest groups first
+"""
+from nino.defines import App
+
+STRATEGIES = ("first-fit", "best-fit", "grouped")
+
+
+def free_runs(occupancy, universes, ignore=()):
+    """Runs of free addresses
+
+    Args:
+        occupancy (dict): devices by address, by universe
+        universes (list): universes to use, in order
+        ignore (set): channels whose addresses are free
+
+    Returns:
+        list of [universe, first address, length]
+    """
+    runs = []
+    for universe in universes:
+        owners = occupancy.get(universe) or [None] * 512
+        start = None
+        for address, owner in enumerate(owners, 1):
+            free = owner is None or owner.channel in ignore
+            if free and start is None:
+                start = address
+            elif not free and start is not None:
+                runs.append([universe, start, address - start])
+                start = None
+        if start is not None:
+            runs.append([universe, start, 513 - start])
+    return runs
+
+
+def allocate(devices, runs, strategy="first-fit", split=True):
+    """Find addresses of devices
+
+    Args:
+        devices (list): (channel, fixture) to patch, in patch order
+        runs (list): [universe, first address, length] free runs, modified
+        strategy (str): "first-fit", "best-fit" or "grouped"
+        split (bool): with "grouped", a group which doesn't fit in one run may
+            be spread over several universes, otherwise it is kept in one
+            universe or not patched
+
+    Returns:
+        (list of (channel, output, universe, fixture), list of channels
+        without room)
+    """
+    patches = []
+    unplaced = []
+    if strategy == "grouped":
+        groups = {}
+        for channel, fixture in devices:
+            groups.setdefault(id(fixture), []).append((channel, fixture))
+        for group in sorted(groups.values(), key=_footprint, reverse=True):
+            run = _best_run(runs, _footprint(group))
+            if run:
+                patches.extend(_place(run, group))
+            elif split:
+                _fit(group, runs, _first_run, patches, unplaced)
+            else:
+                universe_runs = _universe_with_room(runs, group)
+                if universe_runs:
+                    _fit(group, universe_runs, _best_run, patches, unplaced)
+                else:
+                    unplaced.extend(channel for channel, _fixture in group)
+    else:
+        find = _best_run if strategy == "best-fit" else _first_run
+        _fit(devices, runs, find, patches, unplaced)
+    return patches, unplaced
+
+
+def auto_patch(devices, strategy="first-fit", split=True):
+    """Patch devices on free addresses, in one undo step
+
+    Addresses of channels being patched are considered free, except those of
+    channels without room: they stay patched where they were, so allocation is
+    done again without their addresses until all remaining channels fit.
+
+    Args:
+        devices (list): (channel, fixture) to patch, in patch order
+        strategy (str): "first-fit", "best-fit" or "grouped"
+        split (bool): with "grouped", a group may be spread over universes
+
+    Returns:
+        (sorted list of modified channels, list of channels without room)
+    """
+    unplaced = []
+    while True:
+        ignore = {channel for channel, _fixture in devices}
+        runs = free_runs(App().patch.occupancy, App().universes, ignore)
+        patches, missing = allocate(devices, runs, strategy, split)
+        if not missing:
+            break
+        unplaced.extend(missing)
+        devices = [device for device in devices if device[0] not in missing]
+    changed = App().patch.patch_many(patches) if patches else []
+    return changed, unplaced
+
+
+def _fit(devices, runs, find, patches, unplaced):
+    """Place devices one by one
+
+    Args:
+        devices (list): (channel, fixture)
+        runs (list): free runs
+        find (function): run choice
+        patches (list): found patches
+        unplaced (list): channels without room
+    """
+    for channel, fixture in devices:
+        run = find(runs, fixture.get_footprint())
+        if run:
+            patches.extend(_place(run, [(channel, fixture)]))
+        else:
+            unplaced.append(channel)
+
+
+def _place(run, devices):
+    """Place devices at the start of a run
+
+    Args:
+        run (list): [universe, first address, length], modified
+        devices (list): (channel, fixture), fitting in run
+
+    Returns:
+        list of (channel, output, universe, fixture)
+    """
+    patches = []
+    for channel, fixture in devices:
+        footprint = fixture.get_footprint()
+        patches.append((channel, run[1], run[0], fixture))
+        run[1] += footprint
+        run[2] -= footprint
+    return patches
+
+
+def _first_run(runs, footprint):
+    """First run large enough
+
+    Args:
+        runs (list): free runs
+        footprint (int): needed length
+
+    Returns:
+        run or None
+    """
+    for run in runs:
+        if run[2] >= footprint:
+            return run
+    return None
+
+
+def _best_run(runs, footprint):
+    """Smallest run large enough, first one if several
+
+    Args:
+        runs (list): free runs
+        footprint (int): needed length
+
+    Returns:
+        run or None
+    """
+    best = None
+    best_length = 513
+    for run in runs:
+        if footprint <= run[2] < best_length:
+            best = run
+            best_length = run[2]
+            if best_length == footprint:
+                break
+    return best
+
+
+def _universe_with_room(runs, devices):
+    """Runs of the first universe where all devices fit, device by device
+
+    Args:
+        runs (list): free runs
+        devices (list): (channel, fixture)
+
+    Returns:
+        list of runs, empty if no universe has room
+    """
+    universes = []
+    for run in runs:
+        if run[0] not in universes:
+            universes.append(run[0])
+    for universe in universes:
+        universe_runs = [run for run in runs if run[0] == universe]
+        lengths = [run[2] for run in universe_runs]
+        for _channel, fixture in devices:
+            footprint = fixture.get_footprint()
+            fits = [i for i, length in enumerate(lengths) if length >= footprint]
+            if not fits:
+                break
+            best = min(fits, key=lengths.__getitem__)
+            lengths[best] -= footprint
+        else:
+            return universe_runs
+    return []
+
+
+def _footprint(devices):
+    """Total footprint of devices
+
+    Args:
+        devices (list): (channel, fixture)
+
+    Returns:
+        number of addresses
+    """
+    return sum(fixture.get_footprint() for _channel, fixture in devices)
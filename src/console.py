@@ -13,40 +13,282 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 import json
 import os
+import threading
+import time
+import traceback
+import uuid
 import sacn
 
 from gi.repository import GLib
 
-from nino.defines import App, UNIVERSES
+from nino.defines import App
+from nino.drivers import OUTPUT_PRIORITY, create_drivers
+from nino.effects import Effects
 from nino.fixture import Fixture
+from nino.journal import Journal, journal_base, replay
+from nino.merge import Input, Source, merge
 from nino.patch import Patch
 from nino.paths import get_fixtures_dir
+from nino.playback import CueList
+from nino.recorder import Player, Recorder
+from nino.submasters import Submasters
 from nino.undo_redo import UndoManager
 
 
 class DMX:
-    """DMX levels"""
+    """DMX levels
 
-    def __init__(self):
+    Sources only write in their buffers and mark universes dirty, dirty
+    universes are merged and handed to output drivers by the output thread at
+    its next tick.
+
+    Attributes:
+        drivers (list): output drivers
+        refresh (list): views to refresh when levels change
+        levels (dict): last merged frame of each universe in use
+        ltp (dict): LTP layer shared by all sources, one buffer per universe in use
+        sources (dict): merge sources by name
+        dirty (set): universes modified since last flush
+        inhibit (dict): maximum levels allowed by inhibitive submasters, by universe
+        recorder (Recorder): records output if not None
+        removed (set): universes to release at next flush
+    """
+
+    def __init__(self, drivers, refresh):
+        self.drivers = drivers
+        self.refresh = refresh
         self.levels = {}
-        for universe in UNIVERSES:
-            self.levels[universe] = [0] * 512
+        self.ltp = {}
+        self.sources = {}
+        for name in ("programmer", "playback", "effects", "submasters", "replay"):
+            self.sources[name] = Source(name)
+        self.sources["input"] = Input("input", OUTPUT_PRIORITY)
+        self.dirty = set()
+        self.inhibit = {}
+        self.lock = threading.Lock()
+        self.recorder = None
+        self.removed = set()
+
+    def ltp_frame(self, universe):
+        """Get LTP layer of a universe, allocate universe buffers if needed
+
+        Args:
+            universe (int): universe
+
+        Returns:
+            bytearray of 512 slots
+        """
+        frame = self.ltp.get(universe)
+        if frame is None:
+            self.levels[universe] = bytes(512)
+            frame = bytearray(512)
+            self.ltp[universe] = frame
+        return frame
+
+    def set_dirty(self, universe):
+        """Mark universe as modified
+
+        Args:
+            universe (int): universe
+        """
+        with self.lock:
+            self.dirty.add(universe)
+
+    def remove_universe(self, universe):
+        """Release buffers of a universe, done by output thread at next flush
+
+        Args:
+            universe (int): universe
+        """
+        with self.lock:
+            self.removed.add(universe)
+            self.dirty.discard(universe)
+
+    def _release(self, universe):
+        """Release buffers of a universe in all sources
+
+        Args:
+            universe (int): universe
+        """
+        self.levels.pop(universe, None)
+        self.ltp.pop(universe, None)
+        self.inhibit.pop(universe, None)
+        for source in self.sources.values():
+            if isinstance(source, Input):
+                source.remove_universe(universe)
+            else:
+                source.frames.pop(universe, None)
+
+    def flush_dirty(self):
+        """Merge and flush all modified universes"""
+        with self.lock:
+            dirty = self.dirty
+            self.dirty = set()
+            removed = self.removed
+            self.removed = set()
+        for universe in removed:
+            self._release(universe)
+        sources = tuple(self.sources.values())
+        sacn_input = self.sources["input"]
+        for universe in dirty:
+            if universe in sacn_input.overrides:
+                # Input has a higher priority than us
+                frame = bytes(sacn_input.frames[universe])
+            else:
+                frames = [
+                    source.frames[universe]
+                    for source in sources
+                    if universe in source.frames
+                ]
+                frame = merge(self.ltp_frame(universe), frames)
+                limits = self.inhibit.get(universe)
+                if limits:
+                    frame = bytes(map(min, frame, limits))
+            if frame != self.levels[universe]:
+                self.levels[universe] = frame
+                for refresh in self.refresh:
+                    refresh.request(universe)
+                recorder = self.recorder
+                if recorder:
+                    recorder.record(universe, frame)
+            self.flush(universe)
 
     def flush(self, universe):
-        """Flush levels to sACN
+        """Hand universe levels to output drivers
+
+        The same immutable frame is shared by all drivers, without copy.
 
         Args:
-            universe (int): one in UNIVERSES
+            universe (int): universe
         """
-        App().sender[universe].dmx_data = tuple(self.levels[universe])
+        frame = self.levels[universe]
+        for driver in self.drivers:
+            driver.send(universe, frame)
+
+
+class OutputThread(threading.Thread):
+    """DMX refresh engine
+
+    Sample DMX levels at a fixed rate, independently of the GTK main loop.
+    Handlers (fades, effects, ...) are called at each tick, before merging.
+
+    Attributes:
+        dmx (DMX): DMX levels to send
+        period (float): time between two frames in seconds
+        handlers (list): functions called with monotonic time at each tick
+    """
+
+    def __init__(self, dmx, rate):
+        threading.Thread.__init__(self, name="DMX output", daemon=True)
+        self.dmx = dmx
+        self.period = 1 / rate
+        self.handlers = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            try:
+                for handler in self.handlers:
+                    handler(now)
+                self.dmx.flush_dirty()
+            except Exception:  # pylint: disable=broad-except
+                # Keep DMX output running, try again at next tick
+                traceback.print_exc()
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Too late, don't try to catch up missed frames
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def stop(self):
+        """Stop output thread"""
+        self._stop_event.set()
+
+
+class ViewRefresh:
+    """Coalesced view refresh
+
+    Refresh can be requested from any thread, at most one refresh is pending
+    and it runs at the next frame of the view's frame clock.
+
+    Attributes:
+        tab (str): name of the tab to refresh
+        callback (function): called with tab and the set of changed universes
+        universes (set): universes changed since last refresh
+    """
+
+    def __init__(self, tab, callback):
+        self.tab = tab
+        self.callback = callback
+        self.universes = set()
+        self.pending = False
+        self.lock = threading.Lock()
+
+    def request(self, universe):
+        """Ask for a refresh
+
+        Args:
+            universe (int): changed universe
+        """
+        with self.lock:
+            self.universes.add(universe)
+            if self.pending:
+                return
+            self.pending = True
+        GLib.idle_add(self._schedule)
+
+    def _schedule(self):
+        """Wait for next frame if view is visible
+
+        Returns:
+            False to stop idle callback
+        """
+        tab = App().tabs.get(self.tab)
+        if tab and tab.get_mapped():
+            tab.add_tick_callback(self._refresh)
+        else:
+            self._refresh(tab, None)
+        return False
+
+    def _refresh(self, tab, _frame_clock):
+        """Refresh view
+
+        Args:
+            tab (Gtk.Widget): view to refresh
+
+        Returns:
+            False to remove tick callback
+        """
+        with self.lock:
+            universes = self.universes
+            self.universes = set()
+            self.pending = False
+        if tab:
+            self.callback(tab, universes)
+        return False
 
 
 # pylint: disable=too-many-instance-attributes
 class Console:
-    """Application's heart"""
+    """Application's heart
+
+    Attributes:
+        settings (Gio.Settings): application settings
+        show_path (str): show file, None for an untitled show
+    """
 
-    def __init__(self):
+    def __init__(self, settings):
+        self.settings = settings
+        self.show_path = None
         self.tabs = {}
+        # Journal of edits, opened once windows exist
+        self.journal = Journal()
+        self.journal.start()
+        self.journal_started = False
         # Dimmer fixture at index 0
         self.fixtures = []
         dimmer = Fixture("Dimmer")
@@ -56,27 +298,166 @@ class Console:
         self.fixtures_param_grps = load_fixtures_groups()
 
         self.patch = Patch()
-        self.dmx = DMX()
+        # Views refreshed when DMX levels change
+        self.refresh = [
+            ViewRefresh("live", _refresh_live),
+            ViewRefresh("device_controls", _refresh_device_controls),
+        ]
+        # sACN Component IDentifier, to ignore our own packets
+        self.cid = uuid.uuid4().bytes
+        # Output drivers, each one with its own thread
+        self.drivers = create_drivers(self.settings, self.cid)
+        for driver in self.drivers:
+            driver.start()
+        self.dmx = DMX(self.drivers, self.refresh)
+        # Universes allowed, and universes with something patched
+        self.universes = self.settings.universes
+        self.active_universes = set()
+        self.listened_universes = set()
 
-        # Start sACN sender and receiver
-        self.sender = sacn.sACNsender()
-        self.sender.start()
+        # Start sACN receiver
         self.receiver = sacn.sACNreceiver()
+        self.receiver.register_listener("availability", receive_availability)
         self.receiver.start()
-        for universe in UNIVERSES:
-            self.sender.activate_output(universe)
-            self.sender[universe].multicast = True
-            self.receiver.join_multicast(universe)
-            self.receiver.register_listener(
-                "universe", receive_packet, universe=universe
-            )
+        self.settings.connect("changed::universes", self.universes_changed)
+
+        # Output recording and replay
+        self.player = None
+
+        # Main playback, effects and submasters
+        self.cue_list = CueList(self.dmx.sources["playback"])
+        self.effects = Effects(self.dmx, self.dmx.sources["effects"])
+        self.submasters = Submasters(self.dmx, self.dmx.sources["submasters"])
+
+        # Start DMX refresh engine
+        self.output_thread = OutputThread(self.dmx, self.settings.dmx_rate)
+        self.output_thread.handlers.append(self.cue_list.tick)
+        self.output_thread.handlers.append(self.effects.tick)
+        self.output_thread.handlers.append(self.submasters.tick)
+        self.output_thread.handlers.append(expire_senders)
+        self.output_thread.start()
 
         # Undo manager
-        self.undo_manager = UndoManager()
+        self.undo_manager = UndoManager(
+            self.settings.undo_depth, self.settings.undo_memory
+        )
+
+    def update_universes(self):
+        """Activate outputs of allowed universes in use, release the others"""
+        used = self.patch.universes() & set(self.universes)
+        for universe in used - self.active_universes:
+            self.dmx.ltp_frame(universe)
+            for driver in self.drivers:
+                driver.add_universe(universe)
+            self.receiver.join_multicast(universe)
+            self.dmx.sources["input"].add_universe(universe)
+            # sACN receiver can't remove listeners, register each one once
+            if universe not in self.listened_universes:
+                self.listened_universes.add(universe)
+                self.receiver.register_listener(
+                    "universe", receive_packet, universe=universe
+                )
+            self.dmx.set_dirty(universe)
+        for universe in self.active_universes - used:
+            for driver in self.drivers:
+                driver.remove_universe(universe)
+            self.receiver.leave_multicast(universe)
+        self.active_universes = used
+        # Submasters looks and effects are compiled to DMX addresses
+        self.submasters.invalidate()
+        self.effects.recompile()
+
+    def universes_changed(self, _settings, _key):
+        """Universes setting changed, release universes not allowed anymore
+
+        Their packets are then ignored by sACN input.
+        """
+        self.universes = self.settings.universes
+        self.patch.update_views()
+        for universe in set(self.dmx.ltp) - set(self.universes):
+            self.dmx.remove_universe(universe)
+
+    def start_recording(self, path):
+        """Record DMX output
+
+        Args:
+            path (str): recording file
+        """
+        self.stop_recording()
+        # Static universes are never flushed again, record them now
+        self.dmx.recorder = Recorder(path, dict(self.dmx.levels))
+
+    def stop_recording(self):
+        """Stop recording DMX output"""
+        recorder = self.dmx.recorder
+        if recorder:
+            self.dmx.recorder = None
+            recorder.close()
+
+    def start_replay(self, path, speed=1.0):
+        """Replay a recording
+
+        Args:
+            path (str): recording file
+            speed (float): 1 for original timing, 2 for twice faster, ...
+        """
+        self.stop_replay()
+        self.player = Player(path, self.dmx, self.dmx.sources["replay"], speed)
+        self.player.start()
+
+    def stop_replay(self):
+        """Stop replay and release its levels"""
+        if self.player:
+            self.player.stop()
+            self.player.join()
+            self.player = None
+        source = self.dmx.sources["replay"]
+        universes = list(source.frames)
+        source.frames.clear()
+        for universe in universes:
+            self.dmx.set_dirty(universe)
+
+    def start_journal(self):
+        """Replay the journal left by a crash, then start a new journal
+
+        Only done once: the application is activated again at each launch,
+        while the journal of the running session is live.
+        """
+        if self.journal_started:
+            return
+        self.journal_started = True
+        show_file = self.settings.show_file or None
+        path = f"{journal_base(show_file)}.journal"
+        if os.path.exists(path) and replay(path):
+            self.show_path = show_file
+            # Don't append to a journal which may end with a cut entry
+            self.journal.compact()
+        else:
+            self.settings.show_file = ""
+            self.journal.open(None)
+
+    def set_show_path(self, path):
+        """Show has been opened or saved
+
+        Args:
+            path (str): show file
+        """
+        self.show_path = path
+        self.settings.show_file = path
+        self.journal.open(path, path)
 
     def console_exit(self):
         """Stop console"""
-        self.sender.stop()
+        self.journal.close()
+        self.settings.show_file = ""
+        self.stop_replay()
+        self.stop_recording()
+        self.output_thread.stop()
+        self.output_thread.join()
+        for driver in self.drivers:
+            driver.stop()
+            # Driver threads are daemons, don't wait for a stuck one
+            driver.join(1.0)
         self.receiver.stop()
 
 
@@ -92,15 +473,66 @@ def load_fixtures_groups():
     return groups
 
 
-def receive_packet(_packet):
+def receive_packet(packet):
     """Callback when receive sACN packets
 
+    Levels are merged in output, views are refreshed by output.
+    Our own packets are ignored.
+
+    Args:
+        packet (sacn.DataPacket): DMX data
+    """
+    # pylint: disable=protected-access
+    cid = bytes(packet._cid)
+    if cid == App().cid:
+        return
+    if App().settings.ignore_lower_priority and packet.priority < OUTPUT_PRIORITY:
+        return
+    sacn_input = App().dmx.sources["input"]
+    if sacn_input.receive(packet.universe, cid, packet.priority, packet.dmxData):
+        App().dmx.set_dirty(packet.universe)
+
+
+def receive_availability(universe, changed):
+    """Callback when a sACN universe appears or disappears
+
+    Args:
+        universe (int): universe
+        changed (str): 'available' or 'timeout'
+    """
+    if changed == "timeout" and universe in App().active_universes:
+        App().dmx.sources["input"].timeout(universe)
+        App().dmx.set_dirty(universe)
+
+
+def expire_senders(now):
+    """Forget sACN senders which disappeared, called by output thread
+
+    Availability timeouts of the sACN receiver are not enough, as our own
+    output keeps universes available.
+
+    Args:
+        now (float): monotonic time
+    """
+    for universe in App().dmx.sources["input"].expire(now):
+        App().dmx.set_dirty(universe)
+
+
+def _refresh_live(tab, _universes):
+    """Update Live view
+
+    Args:
+        tab (TabLive): Live view
+    """
+    tab.flowbox.queue_draw()
+
+
+def _refresh_device_controls(tab, universes):
+    """Update Device Controls if displayed devices changed
+
     Args:
-        _packet (sacn.DataPacket): DMX data
+        tab (TabDeviceControls): Device Controls
+        universes (set): changed universes
     """
-    if App().tabs.get("live"):
-        # Update Live view
-        GLib.idle_add(App().tabs.get("live").flowbox.queue_draw)
-    if App().tabs.get("device_controls"):
-        # Update Device Controls
-        GLib.idle_add(App().tabs.get("device_controls").update_view)
+    if tab.get_universes() & universes:
+        tab.update_view()
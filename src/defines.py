@@ -14,6 +14,5 @@
 from gi.repository import Gio
 
 MAX_CHANNELS = 1024
-UNIVERSES = [1, 2, 3, 4]
 
 App = Gio.Application.get_default
@@ -14,6 +14,7 @@
 from nino.defines import App
 
 
+# pylint: disable=too-many-instance-attributes
 class Device:
     """A device is a patched fixture
 
@@ -22,6 +23,8 @@ class Device:
         output (int): [1 - 512]
         universe (int): universe
         fixture (Fixture): fixture
+        slots (list): compiled output map, one (parameter, high byte slot,
+            low byte slot or None, color scaling, HTP) tuple per parameter
     """
 
     def __init__(self, channel, output, universe, fixture):
@@ -55,6 +58,33 @@ class Device:
                 elif param_type not in "VIRTUAL":
                     print("Device parameter type '{param_type}' not supported")
                     print("Supported types are : HTP8, LTP8, HTP16, LTP16, VIRTUAL")
+        self.slots = []
+        if output:
+            self.compile_slots()
+
+    def compile_slots(self):
+        """Compile parameters to absolute DMX slots
+
+        Done once at patch time, so sending parameters doesn't need to walk
+        fixture dictionaries.
+        """
+        self.slots = []
+        for name in self.parameters:
+            param = self.fixture.parameters[name]
+            param_type = param.get("type")
+            offset = param.get("offset")
+            scaled = (
+                self.virtual_intensity is not None
+                and App().fixtures_param_grps.get(name) == "Color"
+            )
+            htp = param_type in ("HTP8", "HTP16")
+            if param_type in ("HTP8", "LTP8"):
+                high = self.output + offset.get("High Byte") - 1
+                self.slots.append((name, high, None, scaled, htp))
+            elif param_type in ("HTP16", "LTP16"):
+                high = self.output + offset.get("High Byte") - 1
+                low = self.output + offset.get("Low Byte") - 1
+                self.slots.append((name, high, low, scaled, htp))
 
     def home(self):
         """Put all parameters to default value"""
@@ -68,25 +98,32 @@ class Device:
 
     def send_dmx(self):
         """Send device parameters"""
+        source = App().dmx.sources["programmer"]
+        self.write_dmx(source, self.parameters, self.virtual_intensity)
+        App().journal.parameters(self)
+
+    def write_dmx(self, source, parameters, virtual_intensity=None):
+        """Write parameters values in a merge source
+
+        Args:
+            source (Source): merge source
+            parameters (dict): values by parameter name, may be partial
+            virtual_intensity (float): scale of color parameters, if any
+        """
         if not self.output:
             return
-        for name, value in self.parameters.items():
-            if (
-                self.virtual_intensity is not None
-                and App().fixtures_param_grps.get(name) == "Color"
-            ):
-                value = int(value * self.virtual_intensity)
-            param_type = self.fixture.parameters[name].get("type")
-            offset = self.fixture.parameters[name].get("offset")
-            if param_type in ("HTP8", "LTP8"):
-                out = self.output + offset.get("High Byte") - 1
-                val = (value >> 8) & 0xFF if value > 255 else value
-                App().dmx.levels[self.universe][out] = val
-            elif param_type in ("HTP16", "LTP16"):
-                out = self.output + offset.get("High Byte") - 1
-                val = (value >> 8) & 0xFF
-                out2 = self.output + offset.get("Low Byte") - 1
-                val2 = value & 0xFF
-                App().dmx.levels[self.universe][out] = val
-                App().dmx.levels[self.universe][out2] = val2
-        App().dmx.flush(self.universe)
+        htp_levels = source.frame(self.universe)
+        ltp_levels = App().dmx.ltp_frame(self.universe)
+        for name, high, low, scaled, htp in self.slots:
+            value = parameters.get(name)
+            if value is None:
+                continue
+            if scaled and virtual_intensity is not None:
+                value = int(value * virtual_intensity)
+            levels = htp_levels if htp else ltp_levels
+            if low is None:
+                levels[high] = (value >> 8) & 0xFF if value > 255 else value
+            else:
+                levels[high] = (value >> 8) & 0xFF
+                levels[low] = value & 0xFF
+        App().dmx.set_dirty(self.universe)
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""DMX output drivers"""
+import errno
+import os
+import socket
+import struct
+import threading
+import time
+import sacn
+
+from gi.repository import GLib
+
+ARTNET_PORT = 6454
+OUTPUT_PRIORITY = 100
+
+
+class Driver(threading.Thread):
+    """Output driver
+
+    The output thread hands frames with send(), the driver transmits the
+    latest frame of each universe from its own thread.
+    A frame is only transmitted when it changed, at most once per interval,
+    and the last frame is repeated every keepalive seconds.
+
+    Attributes:
+        keepalive (float): seconds between two transmissions of a static frame
+        interval (float): minimum seconds between two transmissions of a universe
+    """
+
+    def __init__(self, name):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.keepalive = 1.0
+        self.interval = 0.0
+        self._active = set()
+        self._frames = {}
+        self._sent = {}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._running = True
+
+    def send(self, universe, frame):
+        """Queue a frame
+
+        Args:
+            universe (int): universe
+            frame (bytes): 512 DMX levels
+        """
+        with self._lock:
+            self._frames[universe] = frame
+        self._event.set()
+
+    def run(self):
+        self.open()
+        while self._running:
+            self._event.wait(self._timeout())
+            self._event.clear()
+            now = time.monotonic()
+            with self._lock:
+                frames = self._frames
+                self._frames = {}
+                sent = dict(self._sent)
+            for universe, frame in frames.items():
+                last_frame, last_time = sent.get(universe, (None, 0.0))
+                if frame == last_frame:
+                    continue
+                if now - last_time < self.interval:
+                    # Too soon, keep frame unless a newer one is queued
+                    with self._lock:
+                        self._frames.setdefault(universe, frame)
+                    continue
+                sent[universe] = (frame, now)
+                self._transmit(universe, frame, now)
+            # Keepalive of static universes
+            for universe, (frame, last_time) in sent.items():
+                if now - last_time >= self.keepalive:
+                    self._transmit(universe, frame, now)
+        self.close()
+
+    def _transmit(self, universe, frame, now):
+        """Transmit a frame and remember it
+
+        Args:
+            universe (int): universe
+            frame (bytes): 512 DMX levels
+            now (float): monotonic time
+        """
+        with self._lock:
+            if universe not in self._active:
+                return
+            self._sent[universe] = (frame, now)
+        self.transmit(universe, frame)
+
+    def _timeout(self):
+        """Time to wait before next keepalive or delayed frame
+
+        Returns:
+            seconds or None to wait for next frame
+        """
+        with self._lock:
+            deadlines = [last + self.keepalive for _frame, last in self._sent.values()]
+            deadlines.extend(
+                self._sent[universe][1] + self.interval
+                for universe in self._frames
+                if universe in self._sent
+            )
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def stop(self):
+        """Stop driver thread"""
+        self._running = False
+        self._event.set()
+
+    def open(self):
+        """Called in driver thread before sending anything"""
+
+    def close(self):
+        """Called in driver thread when stopped"""
+
+    def add_universe(self, universe):
+        """A universe is now in use
+
+        Args:
+            universe (int): universe
+        """
+        with self._lock:
+            self._active.add(universe)
+
+    def remove_universe(self, universe):
+        """A universe is not used anymore
+
+        Args:
+            universe (int): universe
+        """
+        with self._lock:
+            self._active.discard(universe)
+            self._frames.pop(universe, None)
+            self._sent.pop(universe, None)
+
+    def transmit(self, universe, frame):
+        """Transmit a frame
+
+        Args:
+            universe (int): universe
+            frame (bytes): 512 DMX levels
+        """
+        raise NotImplementedError
+
+
+class SacnDriver(Driver):
+    """sACN (E1.31) output
+
+    Attributes:
+        sender (sacn.sACNsender): sACN sender
+    """
+
+    def __init__(self, rate, cid):
+        Driver.__init__(self, "sACN driver")
+        self.sender = sacn.sACNsender(source_name="niño", cid=tuple(cid), fps=rate)
+        self.sender.start()
+
+    def close(self):
+        self.sender.stop()
+
+    def add_universe(self, universe):
+        self.sender.activate_output(universe)
+        self.sender[universe].multicast = True
+        self.sender[universe].priority = OUTPUT_PRIORITY
+        Driver.add_universe(self, universe)
+
+    def remove_universe(self, universe):
+        Driver.remove_universe(self, universe)
+        self.sender.deactivate_output(universe)
+
+    def transmit(self, universe, frame):
+        output = self.sender[universe]
+        if output:
+            output.dmx_data = frame
+
+
+class ArtNetDriver(Driver):
+    """Art-Net output
+
+    Attributes:
+        address (str): destination IP address, broadcast by default
+    """
+
+    # ArtDmx header: ID, OpCode, ProtVerHi, ProtVerLo, Sequence, Physical,
+    # Port-Address, LengthHi, LengthLo
+    header = struct.Struct("<8sHBBBBHBB")
+
+    def __init__(self, address):
+        Driver.__init__(self, "Art-Net driver")
+        self.address = address
+        self.sequence = 0
+        self.socket = None
+
+    def open(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def close(self):
+        self.socket.close()
+
+    def transmit(self, universe, frame):
+        # Sequence 0 disables sequencing, so use 1 to 255
+        self.sequence = self.sequence % 255 + 1
+        # Art-Net universes start at 0
+        header = self.header.pack(
+            b"Art-Net",
+            0x5000,  # OpDmx
+            0,
+            14,  # Protocol version
+            self.sequence,
+            0,
+            universe - 1,
+            len(frame) >> 8,
+            len(frame) & 0xFF,
+        )
+        try:
+            self.socket.sendto(header + frame, (self.address, ARTNET_PORT))
+        except OSError as error:
+            print(f"Art-Net: {error}")
+
+
+class FileDriver(Driver):
+    """Raw output to a file or a named pipe
+
+    Each frame is written as a header (monotonic time, universe, length) and
+    the DMX levels.
+    A named pipe is opened without waiting for a reader: frames are dropped
+    until a reader is connected, or while it is late, and opening is tried
+    again at next frame.
+
+    Attributes:
+        path (str): file path
+        fd (int): file descriptor, None when not open
+    """
+
+    header = struct.Struct("<dHH")
+
+    def __init__(self, path):
+        Driver.__init__(self, "File driver")
+        self.path = path
+        self.fd = None
+        self._error = None
+
+    def open(self):
+        self._open()
+
+    def _open(self):
+        """Open file, without blocking on a named pipe
+
+        Returns:
+            True if file is open
+        """
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_NONBLOCK
+        try:
+            self.fd = os.open(self.path, flags, 0o644)
+        except OSError as error:
+            # ENXIO: named pipe without reader
+            if error.errno != errno.ENXIO and str(error) != self._error:
+                print(f"File driver: {error}")
+                self._error = str(error)
+            return False
+        self._error = None
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def transmit(self, universe, frame):
+        if self.fd is None and not self._open():
+            return
+        header = self.header.pack(time.monotonic(), universe, len(frame))
+        # One write, smaller than PIPE_BUF, is never split in a named pipe
+        try:
+            os.write(self.fd, header + frame)
+        except BlockingIOError:
+            # Reader is late, drop frame
+            pass
+        except OSError:
+            # Reader is gone, open again at next frame
+            self.close()
+
+
+def create_drivers(settings, cid):
+    """Create output drivers from settings
+
+    Args:
+        settings (Settings): application settings
+        cid (bytes): sACN Component IDentifier
+
+    Returns:
+        list of drivers
+    """
+    drivers = []
+    for name in settings.output_drivers:
+        if name == "sacn":
+            drivers.append(SacnDriver(settings.dmx_rate, cid))
+        elif name == "artnet":
+            drivers.append(ArtNetDriver(settings.artnet_address))
+        elif name == "file":
+            path = settings.output_file
+            if not path:
+                path = os.path.join(GLib.get_user_cache_dir(), "nino", "dmx.raw")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            drivers.append(FileDriver(path))
+        else:
+            print(f"Output driver '{name}' not supported")
+            print("Supported drivers are : sacn, artnet, file")
+    for driver in drivers:
+        driver.keepalive = settings.keepalive
+        driver.interval = 1 / settings.max_universe_rate
+    return drivers
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Parametric effects.
+
+An effect moves one parameter of the devices of several channels with a
+waveform. Devices and their output slots are resolved when the effect starts
+and again when the patch changes, so each tick is one pass computing all
+values and one pass writing them.
+"""
+import math
+import threading
+
+from nino.defines import App
+
+WAVEFORMS = {
+    "sine": lambda phase, _steps: 0.5 - 0.5 * math.cos(2 * math.pi * phase),
+    "ramp": lambda phase, _steps: phase,
+    "square": lambda phase, _steps: 1.0 if phase < 0.5 else 0.0,
+    "step": lambda phase, steps: int(phase * steps) / (steps - 1),
+}
+
+
+# pylint: disable=too-many-instance-attributes
+class Effect:
+    """An effect on one parameter of several channels
+
+    Attributes:
+        channels (list): channels running the effect
+        parameter (str): parameter name
+        waveform (str): "sine", "ramp", "square" or "step"
+        rate (float): cycles per second
+        size (int): amplitude in parameter values
+        offset (int): lowest value
+        spread (float): phase spread across devices, in degrees
+        steps (int): number of levels of "step" waveform
+        targets (list): (device, frame, high, low, scaled, htp, color) of each
+            slot, color is the color parameter scaled by a virtual intensity
+        phases (list): phase of each target, from 0 to 1, same for all slots
+            of a device
+        universes (set): universes of targets
+        mini (int): parameter minimum value
+        maxi (int): parameter maximum value
+        start (float): monotonic time of phase origin
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        channels,
+        parameter,
+        *,
+        waveform="sine",
+        rate=1.0,
+        size=255,
+        offset=0,
+        spread=0.0,
+        steps=4,
+    ):
+        self.channels = channels
+        self.parameter = parameter
+        self.waveform = waveform
+        self.rate = rate
+        self.size = size
+        self.offset = offset
+        self.spread = spread
+        self.steps = max(steps, 2)
+        self.targets = []
+        self.phases = []
+        self.universes = set()
+        self.mini = 0
+        self.maxi = 255
+        self.start = 0.0
+
+    def compile(self, source, ltp_frame):
+        """Resolve devices of channels and their output slots
+
+        Args:
+            source (Source): merge source for HTP slots
+            ltp_frame (function): returns LTP layer of a universe
+        """
+        self.targets = []
+        self.universes = set()
+        indexes = []
+        devices = [
+            device
+            for channel in self.channels
+            for device in App().patch.channels.get(channel, {}).values()
+            if device.output
+        ]
+        count = 0
+        for device in devices:
+            targets = self._device_targets(device, source, ltp_frame)
+            if targets:
+                self.targets.extend(targets)
+                indexes.extend([count] * len(targets))
+                count += 1
+                self.universes.add(device.universe)
+                param = device.fixture.parameters[self.parameter]
+                self.mini = param.get("range").get("Minimum")
+                self.maxi = param.get("range").get("Maximum")
+        self.phases = [(self.spread / 360) * i / count % 1.0 for i in indexes]
+        if count == 0:
+            self.mini, self.maxi = 0, 255
+
+    def _device_targets(self, device, source, ltp_frame):
+        """Output slots of a device moved by the effect
+
+        A virtual intensity has no slot, the effect then scales the device
+        color parameters, in the HTP frame.
+
+        Args:
+            device (Device): device
+            source (Source): merge source for HTP slots
+            ltp_frame (function): returns LTP layer of a universe
+
+        Returns:
+            list of targets
+        """
+        param = device.fixture.parameters.get(self.parameter, {})
+        virtual = self.parameter == "Intensity" and param.get("type") == "VIRTUAL"
+        targets = []
+        for name, high, low, scaled, htp in device.slots:
+            if virtual and scaled:
+                frame = source.frame(device.universe)
+                targets.append((device, frame, high, low, False, True, name))
+            elif name == self.parameter:
+                if htp:
+                    frame = source.frame(device.universe)
+                else:
+                    frame = ltp_frame(device.universe)
+                targets.append((device, frame, high, low, scaled, htp, None))
+        return targets
+
+    def values(self, now):
+        """Compute values of all devices
+
+        Args:
+            now (float): monotonic time
+
+        Returns:
+            list of values, one per target
+        """
+        wave = WAVEFORMS[self.waveform]
+        base = (now - self.start) * self.rate
+        offset, size, steps = self.offset, self.size, self.steps
+        mini, maxi = self.mini, self.maxi
+        values = [
+            int(offset + size * wave((base + phase) % 1.0, steps))
+            for phase in self.phases
+        ]
+        return [min(max(value, mini), maxi) for value in values]
+
+    def write(self, values):
+        """Write values in output frames
+
+        Args:
+            values (list): values, one per target
+
+        Returns:
+            set of modified universes
+        """
+        maxi = self.maxi
+        for target, value in zip(self.targets, values):
+            device, frame, high, low, scaled, _htp, color = target
+            if color:
+                value = int(device.parameters.get(color, 0) * value / maxi)
+            elif scaled and device.virtual_intensity is not None:
+                value = int(value * device.virtual_intensity)
+            if low is None:
+                frame[high] = value
+            else:
+                frame[high] = (value >> 8) & 0xFF
+                frame[low] = value & 0xFF
+        return self.universes
+
+    def clear(self):
+        """Release HTP slots, LTP slots keep their last value
+
+        Returns:
+            set of modified universes
+        """
+        for _device, frame, high, low, _scaled, htp, _color in self.targets:
+            if htp:
+                frame[high] = 0
+                if low is not None:
+                    frame[low] = 0
+        return self.universes
+
+
+class Effects:
+    """Running effects, computed by output thread
+
+    Attributes:
+        dmx (DMX): DMX levels
+        source (Source): merge source to write in
+        running (list): running effects
+    """
+
+    def __init__(self, dmx, source):
+        self.dmx = dmx
+        self.source = source
+        self.running = []
+        self.lock = threading.Lock()
+
+    def start(self, effect, now):
+        """Start an effect
+
+        Args:
+            effect (Effect): effect to start
+            now (float): monotonic time, phase origin
+        """
+        effect.compile(self.source, self.dmx.ltp_frame)
+        effect.start = now
+        with self.lock:
+            self.running.append(effect)
+
+    def stop(self, effect):
+        """Stop an effect
+
+        Args:
+            effect (Effect): running effect
+        """
+        with self.lock:
+            if effect not in self.running:
+                return
+            self.running.remove(effect)
+            universes = effect.clear()
+        for universe in universes:
+            self.dmx.set_dirty(universe)
+
+    def find(self, channels, parameter):
+        """Find a running effect
+
+        Args:
+            channels (list): channels of effect
+            parameter (str): parameter name
+
+        Returns:
+            Effect or None
+        """
+        with self.lock:
+            for effect in self.running:
+                if effect.channels == channels and effect.parameter == parameter:
+                    return effect
+        return None
+
+    def recompile(self):
+        """Patch changed, resolve devices of running effects again"""
+        universes = set()
+        with self.lock:
+            for effect in self.running:
+                universes |= effect.clear()
+                effect.compile(self.source, self.dmx.ltp_frame)
+                universes |= effect.universes
+        for universe in universes:
+            self.dmx.set_dirty(universe)
+
+    def stop_all(self):
+        """Stop all effects and release their levels"""
+        with self.lock:
+            self.running = []
+            universes = list(self.source.frames)
+            self.source.frames.clear()
+        for universe in universes:
+            self.dmx.set_dirty(universe)
+
+    def tick(self, now):
+        """Compute running effects, called by output thread
+
+        Args:
+            now (float): monotonic time
+        """
+        universes = set()
+        with self.lock:
+            for effect in self.running:
+                universes |= effect.write(effect.values(now))
+        for universe in universes:
+            self.dmx.set_dirty(universe)
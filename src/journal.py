@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Journal of show edits, for crash recovery.
+
+Edits are appended to SHOW.journal, next to the show file, and written to
+disk by the journal thread in batches, with one fsync per batch. After a
+crash, the journal is replayed on top of its snapshot. When the journal gets
+long, the show is saved to SHOW.autosave and the journal restarts from it.
+Both files are removed once the show is saved or closed.
+
+Undo and redo are recorded by their result: a snapshot doesn't keep the undo
+history, so undoing an edit made before the snapshot can't be replayed.
+
+A journal starts with ["journal", snapshot path or null], followed by one
+entry per line:
+
+    ["do", method, arguments]          undoable patch command, fixtures as
+                                       {"fixture": [manufacturer, model, mode]}
+    ["begin"], ["commit"]              patch transaction
+    ["channels", rows]                 devices of channels after undo or redo,
+                                       one [channel, [[output, universe,
+                                       fixture, values], ...]] row per channel
+    ["parameters", channel, output, values]
+    ["cue", number, levels]
+    ["submaster", index, inhibitive, look]
+"""
+import contextlib
+import json
+import os
+import threading
+from types import MappingProxyType
+
+from gi.repository import GLib
+
+from nino.defines import App
+from nino.fixture import Fixture
+from nino.show import (
+    find_fixture,
+    fixture_key,
+    load_show,
+    new_device,
+    rows_to_levels,
+    save_show,
+)
+
+# Seconds to wait for more entries before writing a batch
+SYNC_DELAY = 0.5
+# Number of entries before saving a new snapshot
+COMPACT = 5000
+
+
+def journal_base(show_path):
+    """Path of journal files, without extension
+
+    Args:
+        show_path (str): show file or None for an untitled show
+
+    Returns:
+        path
+    """
+    if show_path:
+        return show_path
+    return os.path.join(GLib.get_user_cache_dir(), "nino", "untitled")
+
+
+# pylint: disable=too-many-instance-attributes
+class Journal(threading.Thread):
+    """Append-only journal
+
+    Attributes:
+        base (str): path of journal files without extension, None if closed
+        enabled (bool): entries are recorded
+        entries (int): number of entries since snapshot
+        compacting (bool): a new snapshot is pending
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name="Journal", daemon=True)
+        self.base = None
+        self.enabled = True
+        self.entries = 0
+        self.compacting = False
+        self._pending = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def open(self, show_path, snapshot=None):
+        """Start a new journal, previous journal files are removed
+
+        Args:
+            show_path (str): show file or None for an untitled show
+            snapshot (str): show file with state before first entry, None if empty
+        """
+        base = journal_base(show_path)
+        with self._file_lock:
+            self._close(keep=snapshot)
+            os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+            # Kept open until next open() or close()
+            # pylint: disable-next=consider-using-with
+            self._file = open(f"{base}.journal", "wb")
+            self._file.write(_line(["journal", snapshot]))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.base = base
+            with self._lock:
+                self._pending = []
+                self.entries = 0
+
+    def close(self):
+        """Stop journal and remove its files"""
+        self._stop_event.set()
+        self._event.set()
+        self.join()
+        with self._file_lock:
+            self._close()
+
+    def _close(self, keep=None):
+        """Close journal file and remove journal files
+
+        Args:
+            keep (str): file not to remove
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self.base:
+            for path in (f"{self.base}.journal", f"{self.base}.autosave"):
+                if path != keep and os.path.exists(path):
+                    os.remove(path)
+        self.base = None
+
+    def append(self, entry):
+        """Add an entry, may be called from any thread
+
+        Args:
+            entry (list): journal entry
+        """
+        if not self.enabled or not self.base:
+            return
+        with self._lock:
+            self._pending.append(_line(entry))
+            self.entries += 1
+            compact = self.entries >= COMPACT and not self.compacting
+            if compact:
+                self.compacting = True
+        self._event.set()
+        if compact:
+            GLib.idle_add(self.compact)
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Don't record entries, while loading or replaying"""
+        enabled = self.enabled
+        self.enabled = False
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+    def compact(self):
+        """Save show to a snapshot and restart journal, in GTK thread
+
+        Returns:
+            False to stop idle callback
+        """
+        snapshot = f"{journal_base(App().show_path)}.autosave"
+        save_show(snapshot)
+        self.open(App().show_path, snapshot)
+        self.compacting = False
+        return False
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._event.wait()
+            self._event.clear()
+            # Wait for more entries to write them at once
+            self._stop_event.wait(SYNC_DELAY)
+            self._sync()
+        self._sync()
+
+    def _sync(self):
+        """Write pending entries to disk"""
+        with self._file_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = []
+            if not pending or not self._file:
+                return
+            self._file.write(b"".join(pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def command(self, command):
+        """Record an undoable command
+
+        Args:
+            command (Command): command
+        """
+        args = [_encode(arg) for arg in command.args]
+        self.append(["do", command.do_method.__name__, args])
+
+    def parameters(self, device):
+        """Record device parameters
+
+        Args:
+            device (Device): device
+        """
+        output = f"{device.output}.{device.universe}"
+        self.append(["parameters", device.channel, output, device.parameters])
+
+    def channels(self, channels):
+        """Record devices of channels, after undo or redo
+
+        Args:
+            channels (iterable): modified channels
+        """
+        rows = []
+        for channel in sorted(channels):
+            devices = App().patch.channels.get(channel, {}).values()
+            rows.append(
+                [
+                    channel,
+                    [
+                        [
+                            device.output,
+                            device.universe,
+                            fixture_key(device.fixture),
+                            list(device.parameters.values()),
+                        ]
+                        for device in devices
+                    ],
+                ]
+            )
+        self.append(["channels", rows])
+
+
+def _encode(arg):
+    """Command argument to JSON value
+
+    Args:
+        arg: argument, may be a list or tuple of arguments
+
+    Returns:
+        JSON value
+    """
+    if isinstance(arg, Fixture):
+        return {"fixture": fixture_key(arg)}
+    if isinstance(arg, (list, tuple)):
+        return [_encode(item) for item in arg]
+    return arg
+
+
+def _decode(arg):
+    """JSON value to command argument
+
+    Args:
+        arg: JSON value
+
+    Returns:
+        argument, lists and tuples are decoded as lists
+    """
+    if isinstance(arg, dict):
+        return find_fixture(*arg["fixture"])
+    if isinstance(arg, list):
+        return [_decode(item) for item in arg]
+    return arg
+
+
+def _line(entry):
+    """Encode an entry
+
+    Args:
+        entry (list): journal entry
+
+    Returns:
+        bytes of a JSON line
+    """
+    return json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+
+
+def replay(path):
+    """Replay a journal on top of its snapshot
+
+    An incomplete last entry, cut by a crash, is ignored.
+
+    Args:
+        path (str): journal file
+
+    Returns:
+        True if replayed
+    """
+    try:
+        with open(path, "rb") as journal:
+            lines = journal.readlines()
+        _name, snapshot = json.loads(lines[0])
+    except (OSError, ValueError, IndexError) as error:
+        print(f"Can't replay {path}: {error}")
+        return False
+    with App().journal.paused():
+        if snapshot and not load_show(snapshot):
+            return False
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            try:
+                _replay_entry(entry)
+            except (ValueError, KeyError, TypeError, IndexError) as error:
+                # Unknown fixture or malformed entry
+                print(f"Can't replay {entry}: {error}")
+        # Transaction cut by the crash
+        while App().undo_manager.in_transaction:
+            App().undo_manager.commit()
+    App().patch.update_views()
+    return True
+
+
+def _replay_entry(entry):
+    """Replay one journal entry
+
+    Args:
+        entry (list): journal entry
+    """
+    kind = entry[0]
+    if kind == "do":
+        _name, method, args = entry
+        getattr(App().patch, method)(*_decode(args))
+    elif kind == "begin":
+        App().undo_manager.begin()
+    elif kind == "commit":
+        App().undo_manager.commit()
+    elif kind == "channels":
+        _replay_channels(entry[1])
+    elif kind == "parameters":
+        _name, channel, output, values = entry
+        _replay_parameters(channel, output, values)
+    elif kind == "cue":
+        _name, number, levels = entry
+        App().cue_list.record(number, rows_to_levels(levels))
+    elif kind == "submaster":
+        _name, index, inhibitive, look = entry
+        App().submasters.record(index, rows_to_levels(look), inhibitive)
+
+
+def _replay_channels(rows):
+    """Restore patch of channels changed by an undo or a redo
+
+    Args:
+        rows (list): [channel, devices] rows, devices being [output, universe,
+            fixture reference, parameters values], empty for unpatched channels
+    """
+    channels = App().patch.channels
+    for channel, devices in rows:
+        if devices:
+            devices = {
+                f"{output}.{universe}": new_device(
+                    channel, output, universe, find_fixture(*fixture), values
+                )
+                for output, universe, fixture, values in devices
+            }
+            channels = channels.set(channel, MappingProxyType(devices))
+        else:
+            channels = channels.delete(channel)
+    App().patch.restore(channels)
+
+
+def _replay_parameters(channel, output, values):
+    """Restore parameters values of a device
+
+    Args:
+        channel (int): channel
+        output (str): "output.universe" of device
+        values (dict): parameters values by name
+    """
+    device = App().patch.channels.get(channel, {}).get(output)
+    if device:
+        device.parameters.update(values)
+        if device.virtual_intensity is not None:
+            param = device.fixture.parameters["Intensity"]
+            maxi = param.get("range").get("Maximum")
+            device.virtual_intensity = device.parameters["Intensity"] / maxi
+        device.send_dmx()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Merge of several DMX sources at the output stage.
+
+HTP slots are written in each source's own frames, LTP slots are written in
+one LTP layer shared by all sources, so the latest touched value wins.
+As an HTP slot is always 0 in the LTP layer and an LTP slot is always 0 in
+sources frames, one maximum over all buffers merges a whole universe.
+sACN input and recordings replay are exceptions: their frames hold every slot,
+merged HTP.
+"""
+import threading
+import time
+
+NO_LEVELS = bytes(512)
+# Seconds without packets before a sACN sender is forgotten (E1.31)
+SENDER_TIMEOUT = 2.5
+
+
+class Source:
+    """A source of DMX levels (programmer, playback, submasters, ...)
+
+    Attributes:
+        name (str): source name
+        frames (dict): HTP levels, one buffer per universe, allocated on first use
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = {}
+
+    def frame(self, universe):
+        """Get source levels for a universe
+
+        Args:
+            universe (int): universe
+
+        Returns:
+            bytearray of 512 slots
+        """
+        frame = self.frames.get(universe)
+        if frame is None:
+            frame = bytearray(512)
+            self.frames[universe] = frame
+        return frame
+
+
+class Input(Source):
+    """sACN input
+
+    Senders of a universe with the highest priority are merged HTP. The
+    result is merged with other sources when its priority equals our output
+    priority, replaces our output when higher and is ignored when lower.
+    Senders not received for SENDER_TIMEOUT seconds are forgotten.
+
+    Buffers are allocated when a universe is listened and when a sender
+    appears, packets levels are then copied and merged in place.
+
+    Attributes:
+        priority (int): our output priority
+        senders (dict): [levels, priority, last packet monotonic time] of each
+            sender, by universe and CID
+        overrides (set): universes where input has a higher priority than us
+    """
+
+    def __init__(self, name, priority):
+        Source.__init__(self, name)
+        self.priority = priority
+        self.senders = {}
+        self.overrides = set()
+        self.lock = threading.Lock()
+
+    def add_universe(self, universe):
+        """Allocate buffers of a listened universe
+
+        Args:
+            universe (int): universe
+        """
+        with self.lock:
+            self.frame(universe)
+            self.senders.setdefault(universe, {})
+
+    def remove_universe(self, universe):
+        """Release buffers of a universe not listened anymore
+
+        Args:
+            universe (int): universe
+        """
+        with self.lock:
+            self.frames.pop(universe, None)
+            self.senders.pop(universe, None)
+            self.overrides.discard(universe)
+
+    def receive(self, universe, cid, priority, data):
+        """Ingest levels of an incoming packet
+
+        Args:
+            universe (int): universe
+            cid (bytes): sender Component IDentifier
+            priority (int): sender priority
+            data (tuple): DMX levels
+
+        Returns:
+            False if universe is not listened
+        """
+        with self.lock:
+            senders = self.senders.get(universe)
+            if senders is None:
+                return False
+            sender = senders.get(cid)
+            if sender is None:
+                sender = [bytearray(512), priority, 0.0]
+                senders[cid] = sender
+            sender[0][: len(data)] = data
+            sender[1] = priority
+            sender[2] = time.monotonic()
+            self._merge(universe)
+        return True
+
+    def timeout(self, universe):
+        """Forget senders of a universe which is not received anymore
+
+        Args:
+            universe (int): universe
+        """
+        with self.lock:
+            senders = self.senders.get(universe)
+            if senders:
+                senders.clear()
+                self._merge(universe)
+
+    def expire(self, now):
+        """Forget senders not received for SENDER_TIMEOUT seconds
+
+        Args:
+            now (float): monotonic time
+
+        Returns:
+            list of modified universes
+        """
+        modified = []
+        with self.lock:
+            for universe, senders in self.senders.items():
+                expired = [
+                    cid
+                    for cid, sender in senders.items()
+                    if now - sender[2] > SENDER_TIMEOUT
+                ]
+                if expired:
+                    for cid in expired:
+                        del senders[cid]
+                    self._merge(universe)
+                    modified.append(universe)
+        return modified
+
+    def _merge(self, universe):
+        """Merge senders of a universe in place
+
+        Args:
+            universe (int): universe
+        """
+        frame = self.frame(universe)
+        senders = self.senders.get(universe, {})
+        top = -1
+        for sender in senders.values():
+            if sender[1] > top:
+                top = sender[1]
+        if top < self.priority:
+            frame[:] = NO_LEVELS
+            self.overrides.discard(universe)
+            return
+        first = True
+        for levels, priority, _seen in senders.values():
+            if priority != top:
+                continue
+            if first:
+                frame[:] = levels
+                first = False
+            else:
+                _max_into(frame, levels)
+        if top > self.priority:
+            self.overrides.add(universe)
+        else:
+            self.overrides.discard(universe)
+
+    def device_level(self, device, name):
+        """Input level of a device parameter, mapped through the patch
+
+        Args:
+            device (Device): patched device
+            name (str): parameter name
+
+        Returns:
+            level or None if not received
+        """
+        frame = self.frames.get(device.universe)
+        if frame is None:
+            return None
+        for param, high, low, _scaled, _htp in device.slots:
+            if param == name:
+                if low is None:
+                    return frame[high]
+                return (frame[high] << 8) | frame[low]
+        return None
+
+
+def _max_into(frame, levels):
+    """Merge levels HTP into a frame, in place
+
+    Args:
+        frame (bytearray): 512 levels, modified
+        levels (bytearray): 512 levels
+    """
+    for address in range(512):
+        level = levels[address]
+        if level > frame[address]:
+            frame[address] = level
+
+
+def merge(ltp, frames):
+    """Merge levels of a universe
+
+    Args:
+        ltp (bytearray): LTP layer
+        frames (list): HTP frames of sources using this universe
+
+    Returns:
+        bytes of 512 merged levels
+    """
+    if frames:
+        return bytes(map(max, ltp, *frames))
+    return bytes(ltp)
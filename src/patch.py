@@ -11,10 +11,13 @@
 # GNU General Public License for more details.
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
-import copy
+import contextlib
+import sys
+from types import MappingProxyType
 
 from nino.device import Device
 from nino.defines import App
+from nino.pmap import PMap
 from nino.tab_patch import update_channels_list
 from nino.undo_redo import undoable
 
@@ -22,13 +25,24 @@ from nino.undo_redo import undoable
 class Patch:
     """Channels associate with devices
 
+    The patch is persistent: channels are never modified in place, each
+    change builds a new map sharing untouched channels with the old one. An
+    undo point is the map before a command.
+
     Attributes:
         app: Gio.Application
-        channels (dic): each channel can have multiple devices with same fixture
+        channels (PMap): read-only devices by output, by channel. Each channel
+            can have multiple devices with same fixture
+        occupancy (dict): by universe, device patched on each of the 512
+            addresses or None, kept up to date with channels
+        used (dict): by universe, number of occupied addresses, kept with
+            occupancy
     """
 
     def __init__(self):
-        self.channels = {}
+        self.channels = PMap()
+        self.occupancy = {}
+        self.used = {}
 
     @undoable
     def patch_channel(self, channel, output, universe, fixture):
@@ -44,28 +58,21 @@ class Patch:
         if channel in self.channels:
             # Reset DMX output
             for device in self.channels[channel].values():
-                for name in device.parameters.keys():
-                    device.parameters[name] = 0
-                device.send_dmx()
+                _reset_dmx(device)
             # Depatch
             if output == 0:
-                del self.channels[channel]
-                App().tabs.get("live").channels[channel - 1].device = None
+                self._set_devices(channel, None)
+                App().tabs.get("live").channels[channel - 1].devices = []
+                self.update_universes()
                 return
-            # Patch new device
-            device = Device(channel, output, universe, fixture)
-            self.channels[channel] = {}
-            self.channels[channel][f"{output}.{universe}"] = device
-            device.send_dmx()
-        else:
-            # New patch, create device
-            device = Device(channel, output, universe, fixture)
-            self.channels[channel] = {}
-            self.channels[channel][f"{output}.{universe}"] = device
-            device.send_dmx()
+        # Patch new device
+        device = Device(channel, output, universe, fixture)
+        self._set_devices(channel, {f"{output}.{universe}": device})
+        device.send_dmx()
         # Update Live View
         devices = list(self.channels[channel].values())
         App().tabs.get("live").channels[channel - 1].devices = devices
+        self.update_universes()
 
     @undoable
     def insert_output(self, channel, output, universe, fixture):
@@ -77,19 +84,185 @@ class Patch:
             universe (int): Universe
             fixture (Fixture): fixture to use
         """
-        if channel in self.channels:
-            # Channel already patched
-            device = Device(channel, output, universe, fixture)
-        else:
-            # New patch, create device
-            device = Device(channel, output, universe, fixture)
-            self.channels[channel] = {}
-
-        self.channels[channel][f"{output}.{universe}"] = device
+        device = Device(channel, output, universe, fixture)
+        devices = dict(self.channels.get(channel, {}))
+        devices[f"{output}.{universe}"] = device
+        self._set_devices(channel, devices)
         device.send_dmx()
         # Update Live View
         devices = list(self.channels[channel].values())
         App().tabs.get("live").channels[channel - 1].devices = devices
+        self.update_universes()
+
+    @undoable
+    def patch_many(self, patches):
+        """Patch several channels at once
+
+        Devices already patched on the new addresses are depatched, as well as
+        devices of the patched channels. DMX levels are written once per
+        device and views are updated once.
+
+        Args:
+            patches (list): (channel, output, universe, fixture) tuples, output
+                0 to depatch a channel
+
+        Returns:
+            sorted list of modified channels
+        """
+        source = App().dmx.sources["programmer"]
+        changed = set()
+        new = []
+        for channel, output, universe, fixture in patches:
+            depatch = [channel]
+            device = None
+            if output:
+                device = Device(channel, output, universe, fixture)
+                last = output + device.footprint - 1
+                occupants = self.occupants(universe, output, last)
+                depatch.extend(occupant.channel for occupant in occupants)
+            changed.update(self._depatch(depatch))
+            if device:
+                self._set_devices(channel, {f"{output}.{universe}": device})
+                new.append(device)
+                changed.add(channel)
+        for device in new:
+            if self.channels.get(device.channel, {}).get(
+                f"{device.output}.{device.universe}"
+            ):
+                device.write_dmx(source, device.parameters, device.virtual_intensity)
+        live = App().tabs.get("live")
+        for channel in changed:
+            live.channels[channel - 1].devices = list(
+                self.channels.get(channel, {}).values()
+            )
+        live.flowbox.invalidate_filter()
+        self.update_universes()
+        return sorted(changed)
+
+    def _depatch(self, channels):
+        """Depatch channels and reset their DMX levels
+
+        Args:
+            channels (list): channels to depatch
+
+        Returns:
+            list of channels which were patched
+        """
+        depatched = []
+        for channel in channels:
+            devices = self.channels.get(channel)
+            if devices is None:
+                continue
+            for device in devices.values():
+                _reset_dmx(device)
+            self._set_devices(channel, None)
+            depatched.append(channel)
+        return depatched
+
+    def _set_devices(self, channel, devices):
+        """Replace devices of a channel
+
+        Args:
+            channel (int): Channel [1 - MAX_CHANNELS]
+            devices (dict): devices by output, None to depatch channel
+        """
+        self._unindex(self.channels.get(channel, {}).values())
+        if devices is None:
+            self.channels = self.channels.delete(channel)
+        else:
+            self.channels = self.channels.set(channel, MappingProxyType(devices))
+            self._index(devices.values())
+
+    def replace(self, channels):
+        """Replace whole patch, when loading a show
+
+        Args:
+            channels (dict): devices by output, by channel
+        """
+        self.channels = PMap.from_dict(
+            {
+                channel: MappingProxyType(dict(devices))
+                for channel, devices in channels.items()
+            }
+        )
+        self.occupancy = {}
+        self.used = {}
+        for devices in channels.values():
+            self._index(devices.values())
+
+    def universes(self):
+        """Universes with patched devices
+
+        Returns:
+            set of universes
+        """
+        return {universe for universe, used in self.used.items() if used}
+
+    def occupants(self, universe, first, last):
+        """Devices patched on a range of addresses
+
+        Args:
+            universe (int): universe
+            first (int): first address [1 - 512]
+            last (int): last address [1 - 512]
+
+        Returns:
+            list of devices, in addresses order
+        """
+        owners = self.occupancy.get(universe)
+        if not owners:
+            return []
+        return list(dict.fromkeys(owner for owner in owners[first - 1 : last] if owner))
+
+    def _index(self, devices):
+        """Add devices to occupancy index
+
+        Args:
+            devices (iterable): devices
+        """
+        for device in devices:
+            if not device.output:
+                continue
+            owners = self.occupancy.setdefault(device.universe, [None] * 512)
+            start = device.output - 1
+            end = min(start + device.footprint, 512)
+            free = owners[start:end].count(None)
+            owners[start:end] = [device] * (end - start)
+            self.used[device.universe] = self.used.get(device.universe, 0) + free
+
+    def _unindex(self, devices):
+        """Remove devices from occupancy index
+
+        Args:
+            devices (iterable): devices
+        """
+        for device in devices:
+            owners = self.occupancy.get(device.universe)
+            if not device.output or not owners:
+                continue
+            start = device.output - 1
+            for address in range(start, min(start + device.footprint, 512)):
+                if owners[address] is device:
+                    owners[address] = None
+                    self.used[device.universe] -= 1
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group patch commands in one undo step, with one outputs update"""
+        App().journal.append(["begin"])
+        App().undo_manager.begin()
+        try:
+            yield
+        finally:
+            App().undo_manager.commit()
+            App().journal.append(["commit"])
+            self.update_universes()
+
+    # pylint: disable=no-self-use
+    def update_universes(self):
+        """Update outputs in use, at the end of transactions"""
+        if not App().undo_manager.in_transaction:
+            App().update_universes()
 
     # pylint: disable=no-self-use
     def do(self, command):
@@ -101,10 +274,18 @@ class Patch:
         Returns:
             command result
         """
-        return App().undo_manager.do(command)
+        App().journal.command(command)
+        # Devices parameters are part of the command
+        with App().journal.paused():
+            return App().undo_manager.do(command)
 
     def undo(self):
         """Update views after undo."""
+        self.update_views()
+
+    def update_views(self):
+        """Update views after patch changes."""
+        App().update_universes()
         if App().tabs.get("patch"):
             App().tabs.get("patch").sacn.update_view()
             model = App().tabs.get("patch").treeview.get_model()
@@ -129,20 +310,83 @@ class Patch:
         """Update views after redo."""
         self.undo()
 
-    def copy(self):
+    def copy(self, *_args):
+        """Save patch before a command
+
+        The patch is never modified in place, keeping it is enough.
+
+        Returns:
+            PMap of channels
         """
+        return self.channels
+
+    # pylint: disable=no-self-use
+    def sizeof(self, restore_point, target, *_args):
+        """Memory kept by a restore point
+
+        A command copies the nodes leading to its channels and replaces the
+        channels' devices, restore point only keeps these ones. Fixtures are
+        shared by all devices and not counted. Called before the command, so
+        occupancy still matches the restore point.
+
+        Args:
+            restore_point (PMap): channels before command
+            target (int or list): channel modified by the command, or patches
+                of patch_many()
+
         Returns:
-            a copy of patch object
+            estimated size in bytes
         """
-        patch = Patch()
-        # Need deepcopy for channels with several outputs
-        patch.channels = copy.deepcopy(self.channels)
-        return patch
+        if isinstance(target, list):
+            channels = {patch[0] for patch in target}
+            # Channels on the new addresses are depatched too
+            for _channel, output, universe, fixture in target:
+                if output:
+                    last = output + fixture.get_footprint() - 1
+                    occupants = self.occupants(universe, output, last)
+                    channels.update(device.channel for device in occupants)
+        else:
+            channels = {target}
+        size = 0
+        for channel in channels:
+            size += restore_point.path_size(channel)
+            devices = restore_point.get(channel)
+            if devices is not None:
+                size += sys.getsizeof(devices) + sys.getsizeof(dict(devices))
+                for device in devices.values():
+                    size += sys.getsizeof(device) + sys.getsizeof(vars(device))
+                    size += sys.getsizeof(device.parameters)
+        return size
+
+    def restore(self, restore_point):
+        """Restore patch to a previous state
 
-    def restore(self, patch):
-        """Restore patch to the previous state.
+        Only channels which differ are output again.
 
         Args:
-            patch: patch object
+            restore_point (PMap): channels
         """
-        self.channels = patch.channels
+        changed = self.channels.diff(restore_point)
+        source = App().dmx.sources["programmer"]
+        for channel in changed:
+            devices = self.channels.get(channel, {}).values()
+            for device in devices:
+                _reset_dmx(device)
+            self._unindex(devices)
+        self.channels = restore_point
+        for channel in changed:
+            devices = list(restore_point.get(channel, {}).values())
+            self._index(devices)
+            for device in devices:
+                device.write_dmx(source, device.parameters, device.virtual_intensity)
+            App().tabs.get("live").channels[channel - 1].devices = devices
+
+
+def _reset_dmx(device):
+    """Put device output to 0, without changing its parameters
+
+    Args:
+        device (Device): device
+    """
+    zeros = dict.fromkeys(device.parameters, 0)
+    device.write_dmx(App().dmx.sources["programmer"], zeros, 0)
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Cue list playback.
+
+Cue lists are tracking: a cue only stores values which move, other
+parameters keep the value of the last cue which touched them. Full states are
+kept every CHECKPOINT cues, so the state of any cue is rebuilt from the
+nearest checkpoint with at most CHECKPOINT - 1 cues of moves.
+
+GO prepares a crossfade in the GTK thread: only moving parameters are kept,
+with their start value and delta. The output thread then computes the
+crossfade at each tick, before merging, and writes the result in the playback
+source.
+"""
+import bisect
+import threading
+import time
+
+from gi.repository import GLib
+
+from nino.defines import App
+
+CHECKPOINT = 32
+
+
+class Cue:
+    """A cue
+
+    Attributes:
+        number (float): cue number
+        moves (dict): values changed by this cue, by (channel, parameter name)
+        up (float): fade time of rising levels in seconds
+        down (float): fade time of falling levels in seconds
+        delay (float): time before fades start in seconds
+        loader (function): returns moves of a cue not loaded yet
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, number, moves, *, up=5.0, down=5.0, delay=0.0, loader=None):
+        self.number = number
+        self._moves = moves
+        self.up = up
+        self.down = down
+        self.delay = delay
+        self.loader = loader
+
+    @property
+    def moves(self):
+        """Values changed by this cue, loaded on first use
+
+        Returns:
+            dict of values by (channel, parameter name)
+        """
+        if self._moves is None:
+            self._moves = self.loader()
+            self.loader = None
+        return self._moves
+
+
+class Fade:
+    """A running crossfade
+
+    Moving parameters are stored in parallel lists, to compute all of them
+    in one pass.
+
+    Attributes:
+        cue (Cue): cue faded in
+        start (float): monotonic time of GO
+        keys (list): (channel, parameter name) of moving parameters
+        starts (list): values at GO
+        deltas (list): target values minus values at GO
+        rising (list): True if parameter uses up time, False for down time
+        devices (list): (device, channel, parameters names, maximum intensity
+            or None) of devices to write
+    """
+
+    def __init__(self, cue, start):
+        self.cue = cue
+        self.start = start
+        self.keys = []
+        self.starts = []
+        self.deltas = []
+        self.rising = []
+        self.devices = []
+
+    def fractions(self, now):
+        """Progress of down and up fades
+
+        Args:
+            now (float): monotonic time
+
+        Returns:
+            (down, up) fractions, from 0 to 1, or None during delay
+        """
+        elapsed = now - self.start - self.cue.delay
+        if elapsed < 0:
+            return None
+        down = min(elapsed / self.cue.down, 1.0) if self.cue.down > 0 else 1.0
+        up = min(elapsed / self.cue.up, 1.0) if self.cue.up > 0 else 1.0
+        return down, up
+
+
+class CueList:
+    """Tracking cue list and its playback
+
+    Attributes:
+        source (Source): merge source to write in
+        cues (list): cues sorted by number
+        numbers (list): cues numbers, sorted
+        touched (dict): sorted numbers of cues moving each (channel, parameter
+            name), None until needed after loading a show
+        checkpoints (dict): full states by cue index, every CHECKPOINT cues
+        position (int): index of current cue, -1 before first one
+        levels (dict): current playback values by (channel, parameter name)
+        fade (Fade): running crossfade, None if none
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.cues = []
+        self.numbers = []
+        self.touched = {}
+        self.checkpoints = {}
+        self.position = -1
+        self.levels = {}
+        self.fade = None
+        self.lock = threading.Lock()
+
+    def record(self, number, levels, up=5.0, down=5.0, delay=0.0):
+        """Record a cue, replace cue with the same number
+
+        Only values different from the state of previous cue are stored.
+
+        Args:
+            number (float): cue number
+            levels (dict): values by (channel, parameter name)
+            up (float): fade time of rising levels in seconds
+            down (float): fade time of falling levels in seconds
+            delay (float): time before fades start in seconds
+
+        Returns:
+            recorded Cue
+        """
+        index = bisect.bisect_left(self.numbers, number)
+        previous = self.state_at(index - 1)
+        moves = {
+            key: value for key, value in levels.items() if previous.get(key) != value
+        }
+        cue = Cue(number, moves, up=up, down=down, delay=delay)
+        if index < len(self.cues) and self.numbers[index] == number:
+            touched = self.touch_index()
+            for key in self.cues[index].moves:
+                touched[key].remove(number)
+            self.cues[index] = cue
+        else:
+            self.cues.insert(index, cue)
+            self.numbers.insert(index, number)
+            if index <= self.position:
+                self.position += 1
+        touched = self.touch_index()
+        for key in moves:
+            bisect.insort(touched.setdefault(key, []), number)
+        # Following states changed, and indexes moved
+        for checkpoint in [i for i in self.checkpoints if i >= index]:
+            del self.checkpoints[checkpoint]
+        return cue
+
+    def state_at(self, index):
+        """Full state of a cue
+
+        Args:
+            index (int): cue index, -1 for state before first cue
+
+        Returns:
+            dict of values by (channel, parameter name)
+        """
+        if index < 0:
+            return {}
+        start = index - index % CHECKPOINT
+        while start >= 0 and start not in self.checkpoints:
+            start -= CHECKPOINT
+        if start < 0:
+            start = -1
+            state = {}
+        else:
+            state = dict(self.checkpoints[start])
+        for i in range(start + 1, index + 1):
+            state.update(self.cues[i].moves)
+            if i % CHECKPOINT == 0:
+                self.checkpoints[i] = dict(state)
+        return state
+
+    def touch_index(self):
+        """Index of cues moving each parameter, built on first use
+
+        Returns:
+            dict of sorted cues numbers by (channel, parameter name)
+        """
+        if self.touched is None:
+            self.touched = {}
+            for cue in self.cues:
+                for key in cue.moves:
+                    self.touched.setdefault(key, []).append(cue.number)
+        return self.touched
+
+    def load(self, cues):
+        """Replace all cues, running fade and playback levels are released
+
+        Args:
+            cues (list): cues sorted by number, moves may be loaded later
+        """
+        with self.lock:
+            self.fade = None
+            self.position = -1
+            self.levels = {}
+            self.source.frames.clear()
+        self.cues = cues
+        self.numbers = [cue.number for cue in cues]
+        self.touched = None
+        self.checkpoints = {}
+
+    def goto_number(self, number):
+        """Crossfade to a cue
+
+        Args:
+            number (float): cue number
+
+        Returns:
+            False if cue doesn't exist
+        """
+        index = bisect.bisect_left(self.numbers, number)
+        if index == len(self.cues) or self.numbers[index] != number:
+            return False
+        self.goto(index)
+        return True
+
+    def go_next(self):
+        """Crossfade to next cue"""
+        if self.position + 1 < len(self.cues):
+            self.goto(self.position + 1)
+
+    def goto(self, index):
+        """Crossfade to a cue
+
+        Args:
+            index (int): cue index
+        """
+        cue = self.cues[index]
+        fade = Fade(cue, time.monotonic())
+        with self.lock:
+            current = dict(self.levels)
+        state = self.state_at(index)
+        # Parameters not touched until this cue come from later cues, they go
+        # back to their default value
+        for key in current.keys() - state.keys():
+            state[key] = None
+        moving = _add_moves(fade, state, current)
+        for channel, names in moving.items():
+            for device in App().patch.channels[channel].values():
+                maxi = None
+                if device.virtual_intensity is not None:
+                    param = device.fixture.parameters["Intensity"]
+                    maxi = param.get("range").get("Maximum")
+                    if "Intensity" not in names:
+                        # Color parameters are scaled by intensity
+                        names = names + ["Intensity"]
+                fade.devices.append((device, channel, names, maxi))
+        with self.lock:
+            self.position = index
+            self.fade = fade
+        GLib.idle_add(_refresh_cue_list)
+
+    def tick(self, now):
+        """Compute running crossfade, called by output thread
+
+        Args:
+            now (float): monotonic time
+        """
+        with self.lock:
+            fade = self.fade
+            if not fade:
+                return
+            fractions = fade.fractions(now)
+            if fractions is None:
+                return
+            values = [
+                int(round(start + delta * fractions[rising]))
+                for start, delta, rising in zip(fade.starts, fade.deltas, fade.rising)
+            ]
+            levels = self.levels
+            levels.update(zip(fade.keys, values))
+            for device, channel, names, maxi in fade.devices:
+                parameters = {name: levels.get((channel, name)) for name in names}
+                virtual_intensity = None
+                if maxi:
+                    virtual_intensity = levels.get((channel, "Intensity"), 0) / maxi
+                device.write_dmx(self.source, parameters, virtual_intensity)
+            if min(fractions) >= 1.0:
+                self.fade = None
+
+
+def _add_moves(fade, state, current):
+    """Add parameters moving to a state to a crossfade
+
+    Args:
+        fade (Fade): crossfade
+        state (dict): target values by (channel, parameter name), None for
+            default value
+        current (dict): current values by (channel, parameter name)
+
+    Returns:
+        dict of moving parameters names by channel
+    """
+    moving = {}
+    for (channel, name), value in state.items():
+        devices = App().patch.channels.get(channel)
+        if not devices:
+            continue
+        device = next(iter(devices.values()))
+        default = device.fixture.parameters.get(name, {}).get("default") or 0
+        if value is None:
+            value = default
+        start = current.get((channel, name))
+        if start is None:
+            start = default
+        if value == start and (channel, name) in current:
+            continue
+        fade.keys.append((channel, name))
+        fade.starts.append(start)
+        fade.deltas.append(value - start)
+        fade.rising.append(value > start)
+        moving.setdefault(channel, []).append(name)
+    return moving
+
+
+def programmer_levels():
+    """Values of all patched devices parameters
+
+    Returns:
+        dict of values by (channel, parameter name)
+    """
+    levels = {}
+    for channel, devices in App().patch.channels.items():
+        for device in devices.values():
+            if not device.output:
+                continue
+            for name, value in device.parameters.items():
+                levels.setdefault((channel, name), value)
+    return levels
+
+
+def _refresh_cue_list():
+    """Update cue list view
+
+    Returns:
+        False to stop idle callback
+    """
+    if App().playback:
+        App().playback.cue_list_view.update_view()
+    return False
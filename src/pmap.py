@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Persistent map.
+
+A hash array mapped trie: each node has up to 32 children, selected by 5 bits
+of the key hash, and a bitmap of present children. Nodes are never modified:
+setting or deleting a key copies the nodes on its path and shares all other
+nodes, so keeping an old version of a map costs nothing.
+
+Children are (key, value) tuples or nodes. Keys whose 32 bits of hash are all
+equal are kept in a bucket.
+"""
+import sys
+
+BITS = 5
+MASK = (1 << BITS) - 1
+# Last shift using hash bits, deeper keys go in buckets
+MAX_SHIFT = 30
+
+
+class _Node:
+    """Trie node
+
+    Attributes:
+        bitmap (int): one bit per present child
+        children (tuple): children in bits order
+    """
+
+    __slots__ = ("bitmap", "children")
+
+    def __init__(self, bitmap, children):
+        self.bitmap = bitmap
+        self.children = children
+
+
+class _Bucket:
+    """Keys with the same hash
+
+    Attributes:
+        entries (tuple): (key, value) tuples
+    """
+
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+EMPTY = _Node(0, ())
+
+
+class PMap:
+    """Immutable map, read like a dict
+
+    Attributes:
+        root (_Node): trie root
+    """
+
+    __slots__ = ("root", "_len")
+
+    def __init__(self, root=EMPTY, length=0):
+        self.root = root
+        self._len = length
+
+    @classmethod
+    def from_dict(cls, items):
+        """Create a map
+
+        Args:
+            items (dict): keys and values
+
+        Returns:
+            PMap
+        """
+        pmap = cls()
+        for key, value in items.items():
+            pmap = pmap.set(key, value)
+        return pmap
+
+    def get(self, key, default=None):
+        """Value of a key
+
+        Args:
+            key: hashable key
+            default: returned if key is not in map
+
+        Returns:
+            value
+        """
+        hashed = _hash(key)
+        node = self.root
+        shift = 0
+        while node.__class__ is _Node:
+            bitmap = node.bitmap
+            bit = 1 << ((hashed >> shift) & MASK)
+            if not bitmap & bit:
+                return default
+            node = node.children[bin(bitmap & (bit - 1)).count("1")]
+            shift += BITS
+        if node.__class__ is _Bucket:
+            for entry in node.entries:
+                if entry[0] == key:
+                    return entry[1]
+            return default
+        return node[1] if node[0] == key else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return (key for key, _value in _items(self.root))
+
+    def __bool__(self):
+        return self._len > 0
+
+    def keys(self):
+        """Iterate over keys"""
+        return iter(self)
+
+    def values(self):
+        """Iterate over values"""
+        return (value for _key, value in _items(self.root))
+
+    def items(self):
+        """Iterate over (key, value)"""
+        return _items(self.root)
+
+    def set(self, key, value):
+        """Map with a key set
+
+        Args:
+            key: hashable key
+            value: value
+
+        Returns:
+            new PMap, or this one if key already has this value
+        """
+        root, added = _set(self.root, 0, _hash(key), key, value)
+        if root is self.root:
+            return self
+        return PMap(root, self._len + added)
+
+    def delete(self, key):
+        """Map without a key
+
+        Args:
+            key: hashable key
+
+        Returns:
+            new PMap, or this one if key is not in map
+        """
+        root = _delete(self.root, 0, _hash(key), key)
+        if root is self.root:
+            return self
+        if root is None:
+            root = EMPTY
+        elif isinstance(root, tuple):
+            # Root stays a node
+            root, _added = _set(EMPTY, 0, _hash(root[0]), *root)
+        return PMap(root, self._len - 1)
+
+    def path_size(self, key):
+        """Memory of nodes leading to a key, which a change of key copies
+
+        Args:
+            key: hashable key
+
+        Returns:
+            size in bytes
+        """
+        hashed = _hash(key)
+        node = self.root
+        shift = 0
+        size = 0
+        while node.__class__ is _Node:
+            size += sys.getsizeof(node) + sys.getsizeof(node.children)
+            bit = 1 << ((hashed >> shift) & MASK)
+            if not node.bitmap & bit:
+                return size
+            node = node.children[_index(node.bitmap, bit)]
+            shift += BITS
+        if node.__class__ is _Bucket:
+            return size + sys.getsizeof(node) + sys.getsizeof(node.entries)
+        return size + sys.getsizeof(node)
+
+    def diff(self, other):
+        """Keys with different values in two maps
+
+        Shared nodes are skipped, so comparing versions of a map only walks
+        the paths which changed.
+
+        Args:
+            other (PMap): other map
+
+        Returns:
+            set of keys
+        """
+        keys = set()
+        _diff(self.root, other.root, keys)
+        return keys
+
+
+_MISSING = object()
+
+
+def _hash(key):
+    """32 bits hash of a key"""
+    return hash(key) & 0xFFFFFFFF
+
+
+def _index(bitmap, bit):
+    """Position of a child in a node"""
+    return bin(bitmap & (bit - 1)).count("1")
+
+
+def _items(node):
+    """Iterate over (key, value) of a sub-trie"""
+    if isinstance(node, tuple):
+        yield node
+    elif isinstance(node, _Bucket):
+        yield from node.entries
+    else:
+        for child in node.children:
+            yield from _items(child)
+
+
+# pylint: disable=too-many-arguments
+def _set(node, shift, hashed, key, value):
+    """Set a key in a sub-trie
+
+    Args:
+        node (_Node or _Bucket): sub-trie root
+        shift (int): hash bits used by node
+        hashed (int): key hash
+        key: key
+        value: value
+
+    Returns:
+        (new node or same node if unchanged, 1 if key was added else 0)
+    """
+    if isinstance(node, _Bucket):
+        entries = node.entries
+        for i, entry in enumerate(entries):
+            if entry[0] == key:
+                if entry[1] is value:
+                    return node, 0
+                entries = entries[:i] + ((key, value),) + entries[i + 1 :]
+                return _Bucket(entries), 0
+        return _Bucket(entries + ((key, value),)), 1
+    bit = 1 << ((hashed >> shift) & MASK)
+    index = _index(node.bitmap, bit)
+    children = node.children
+    if not node.bitmap & bit:
+        children = children[:index] + ((key, value),) + children[index:]
+        return _Node(node.bitmap | bit, children), 1
+    child = children[index]
+    if isinstance(child, tuple):
+        if child[0] == key:
+            if child[1] is value:
+                return node, 0
+            new, added = (key, value), 0
+        else:
+            new, added = _split(child, shift + BITS, hashed, key, value), 1
+    else:
+        new, added = _set(child, shift + BITS, hashed, key, value)
+        if new is child:
+            return node, 0
+    children = children[:index] + (new,) + children[index + 1 :]
+    return _Node(node.bitmap, children), added
+
+
+# pylint: disable=too-many-arguments
+def _split(entry, shift, hashed, key, value):
+    """Sub-trie with an existing entry and a new key"""
+    if shift > MAX_SHIFT:
+        return _Bucket((entry, (key, value)))
+    node, _added = _set(EMPTY, shift, _hash(entry[0]), *entry)
+    node, _added = _set(node, shift, hashed, key, value)
+    return node
+
+
+def _delete(node, shift, hashed, key):
+    """Delete a key in a sub-trie
+
+    Args:
+        node (_Node or _Bucket): sub-trie root
+        shift (int): hash bits used by node
+        hashed (int): key hash
+        key: key
+
+    Returns:
+        new child: node, single entry tuple or None if empty, same node if
+        key is not found
+    """
+    if isinstance(node, _Bucket):
+        entries = tuple(entry for entry in node.entries if entry[0] != key)
+        if len(entries) == len(node.entries):
+            return node
+        return entries[0] if len(entries) == 1 else _Bucket(entries)
+    bit = 1 << ((hashed >> shift) & MASK)
+    if not node.bitmap & bit:
+        return node
+    index = _index(node.bitmap, bit)
+    child = node.children[index]
+    if isinstance(child, tuple):
+        if child[0] != key:
+            return node
+        new = None
+    else:
+        new = _delete(child, shift + BITS, hashed, key)
+        if new is child:
+            return node
+    if new is None:
+        bitmap = node.bitmap & ~bit
+        children = node.children[:index] + node.children[index + 1 :]
+    else:
+        bitmap = node.bitmap
+        children = node.children[:index] + (new,) + node.children[index + 1 :]
+    if not children:
+        return None
+    if len(children) == 1 and isinstance(children[0], tuple):
+        # Move single entry up
+        return children[0]
+    return _Node(bitmap, children)
+
+
+def _diff(first, second, keys):
+    """Collect keys with different values in two sub-tries
+
+    Args:
+        first: node, bucket or entry
+        second: node, bucket or entry at the same place
+        keys (set): found keys
+    """
+    if first is second:
+        return
+    if isinstance(first, _Node) and isinstance(second, _Node):
+        bits = first.bitmap | second.bitmap
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            child1 = child2 = None
+            if first.bitmap & bit:
+                child1 = first.children[_index(first.bitmap, bit)]
+            if second.bitmap & bit:
+                child2 = second.children[_index(second.bitmap, bit)]
+            if child1 is None:
+                keys.update(key for key, _value in _items(child2))
+            elif child2 is None:
+                keys.update(key for key, _value in _items(child1))
+            else:
+                _diff(child1, child2, keys)
+        return
+    items1 = dict(_items(first))
+    items2 = dict(_items(second))
+    for key in items1.keys() | items2.keys():
+        if items1.get(key, _MISSING) is not items2.get(key, _MISSING):
+            keys.add(key)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""DMX output recorder and player.
+
+A recording starts with MAGIC, followed by one record per changed frame:
+time since start (float64), universe (uint16), number of runs (uint16), then
+for each run: first slot (uint16), length (uint16) and levels.
+Runs are changed blocks of BLOCK slots since the previous frame of the same
+universe, all universes starting at 0.
+"""
+import mmap
+import struct
+import threading
+import time
+
+MAGIC = b"NINODMX1"
+BLOCK = 32
+RECORD = struct.Struct("<dHH")
+RUN = struct.Struct("<HH")
+
+
+class Recorder:
+    """Append DMX frames to a recording
+
+    Attributes:
+        path (str): recording file
+    """
+
+    def __init__(self, path, levels=None):
+        """Start recording
+
+        Args:
+            path (str): recording file
+            levels (dict): current frame of each universe, recorded first so
+                static universes are replayed too
+        """
+        self.path = path
+        self.start = time.monotonic()
+        self.frames = {}
+        self.lock = threading.Lock()
+        # Kept open until close()
+        # pylint: disable-next=consider-using-with
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        for universe, frame in (levels or {}).items():
+            self.record(universe, frame)
+
+    def record(self, universe, frame):
+        """Record a frame
+
+        Args:
+            universe (int): universe
+            frame (bytes): 512 DMX levels
+        """
+        last = self.frames.get(universe, bytes(512))
+        runs = []
+        first = None
+        for block in range(0, 512, BLOCK):
+            if frame[block : block + BLOCK] != last[block : block + BLOCK]:
+                if first is None:
+                    first = block
+            elif first is not None:
+                runs.append((first, block))
+                first = None
+        if first is not None:
+            runs.append((first, 512))
+        if not runs:
+            return
+        self.frames[universe] = frame
+        chunks = [RECORD.pack(time.monotonic() - self.start, universe, len(runs))]
+        for first, end in runs:
+            chunks.append(RUN.pack(first, end - first))
+            chunks.append(frame[first:end])
+        with self.lock:
+            if self.file:
+                self.file.write(b"".join(chunks))
+
+    def close(self):
+        """Stop recording"""
+        with self.lock:
+            self.file.close()
+            self.file = None
+
+
+class Player(threading.Thread):
+    """Replay a recording in a merge source
+
+    The recording is memory-mapped, so it's never loaded in memory.
+
+    Attributes:
+        path (str): recording file
+        source (Source): merge source to write in
+        speed (float): 1 for original timing, 2 for twice faster, ...
+    """
+
+    def __init__(self, path, dmx, source, speed=1.0):
+        threading.Thread.__init__(self, name="DMX player", daemon=True)
+        self.path = path
+        self.dmx = dmx
+        self.source = source
+        self.speed = speed
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            with open(self.path, "rb") as recording:
+                with mmap.mmap(recording.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if data[: len(MAGIC)] != MAGIC:
+                        print(f"{self.path} is not a DMX recording")
+                        return
+                    self._play(data)
+        except (OSError, ValueError) as error:
+            # ValueError: empty file can't be mapped
+            print(f"Can't replay {self.path}: {error}")
+
+    def _play(self, data):
+        """Play records
+
+        Args:
+            data (mmap.mmap): recording
+        """
+        offset = len(MAGIC)
+        size = len(data)
+        start = time.monotonic()
+        while offset + RECORD.size <= size and not self._stop_event.is_set():
+            stamp, universe, nb_runs = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            delay = start + stamp / self.speed - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            frame = self.source.frame(universe)
+            for _run in range(nb_runs):
+                if offset + RUN.size > size:
+                    # Truncated recording
+                    return
+                first, length = RUN.unpack_from(data, offset)
+                offset += RUN.size
+                if offset + length > size or first + length > 512:
+                    # Truncated or corrupted recording
+                    return
+                frame[first : first + length] = data[offset : offset + length]
+                offset += length
+            self.dmx.set_dirty(universe)
+
+    def stop(self):
+        """Stop playing"""
+        self._stop_event.set()
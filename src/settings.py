@@ -52,6 +52,132 @@ class Settings(Gio.Settings):
         """
         self.set_boolean("percent", mode)
 
+    @property
+    def dmx_rate(self):
+        """Get DMX refresh rate.
+
+        Returns:
+            Number of frames per second
+        """
+        return self.get_int("dmx-rate")
+
+    @property
+    def universes(self):
+        """Get universes allowed in patch.
+
+        Returns:
+            Sorted list of universes
+        """
+        return sorted(self.get_value("universes").unpack())
+
+    @property
+    def output_drivers(self):
+        """Get output drivers names.
+
+        Returns:
+            List of drivers names
+        """
+        return self.get_strv("output-drivers")
+
+    @property
+    def artnet_address(self):
+        """Get Art-Net destination address.
+
+        Returns:
+            IP address
+        """
+        return self.get_string("artnet-address")
+
+    @property
+    def output_file(self):
+        """Get file output path.
+
+        Returns:
+            Path or empty string for default path
+        """
+        return self.get_string("output-file")
+
+    @property
+    def keepalive(self):
+        """Get keepalive interval of static universes.
+
+        Returns:
+            Seconds
+        """
+        return self.get_double("keepalive")
+
+    @property
+    def max_universe_rate(self):
+        """Get maximum send rate of a universe.
+
+        Returns:
+            Number of frames per second
+        """
+        return self.get_int("max-universe-rate")
+
+    @property
+    def ignore_lower_priority(self):
+        """Ignore incoming sACN with a lower priority than ours.
+
+        Returns:
+            True if lower priority sources are ignored
+        """
+        return self.get_boolean("ignore-lower-priority")
+
+    @property
+    def show_file(self):
+        """Get last opened or saved show.
+
+        Returns:
+            Path or empty string for an untitled show
+        """
+        return self.get_string("show-file")
+
+    @show_file.setter
+    def show_file(self, path):
+        """Set last opened or saved show.
+
+        Args:
+            path (str): show file
+        """
+        self.set_string("show-file", path)
+
+    @property
+    def undo_depth(self):
+        """Get maximum number of undo steps.
+
+        Returns:
+            Number of steps
+        """
+        return self.get_int("undo-depth")
+
+    @property
+    def undo_memory(self):
+        """Get maximum memory used by undo history.
+
+        Returns:
+            Bytes
+        """
+        return self.get_int("undo-memory") * 1024 * 1024
+
+    @property
+    def autopatch_strategy(self):
+        """Get auto patch strategy.
+
+        Returns:
+            "first-fit", "best-fit" or "grouped"
+        """
+        return self.get_string("autopatch-strategy")
+
+    @property
+    def autopatch_split(self):
+        """Split groups of fixtures over universes in auto patch.
+
+        Returns:
+            True if groups may be split
+        """
+        return self.get_boolean("autopatch-split")
+
 
 class TabSettings(Gtk.ScrolledWindow):
     """Settings Dialog
@@ -18,6 +18,11 @@ def setup_shortcuts():
     """Application shortcuts"""
     # General shortcuts
     App().set_accels_for_action("app.quit", ["<Control>q"])
+    App().set_accels_for_action("app.open", ["<Control>o"])
+    App().set_accels_for_action("app.save", ["<Control>s"])
+    App().set_accels_for_action("app.save_as", ["<Shift><Control>s"])
+    App().set_accels_for_action("app.record_output", ["<Control>r"])
+    App().set_accels_for_action("app.replay_output", ["<Shift><Control>r"])
     App().set_accels_for_action("app.live", ["<Control>l"])
     App().set_accels_for_action("app.patch", ["<Control>p"])
     App().set_accels_for_action("app.device_controls", ["<Control>d"])
@@ -51,6 +56,13 @@ def activate_shortcuts():
     App().set_accels_for_action("app.output", ["o"])
     App().set_accels_for_action("app.offset", ["<Shift>o"])
     App().set_accels_for_action("app.insert", ["Insert"])
+    App().set_accels_for_action("app.autopatch", ["<Shift>Insert"])
+    App().set_accels_for_action("app.effect", ["e"])
+    App().set_accels_for_action("app.stop_effects", ["<Shift>e"])
+    App().set_accels_for_action("app.go", ["space"])
+    App().set_accels_for_action("app.goto", ["g"])
+    App().set_accels_for_action("app.record", ["r"])
+    App().set_accels_for_action("app.record_submaster", ["<Shift>r"])
 
 
 def desactivate_shortcuts():
@@ -75,6 +87,13 @@ def desactivate_shortcuts():
     App().set_accels_for_action("app.output", [])
     App().set_accels_for_action("app.offset", [])
     App().set_accels_for_action("app.insert", [])
+    App().set_accels_for_action("app.autopatch", [])
+    App().set_accels_for_action("app.effect", [])
+    App().set_accels_for_action("app.stop_effects", [])
+    App().set_accels_for_action("app.go", [])
+    App().set_accels_for_action("app.goto", [])
+    App().set_accels_for_action("app.record", [])
+    App().set_accels_for_action("app.record_submaster", [])
 
 
 def editable_focus(_widget, event):
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Show files.
+
+A show file is a text file with one compact JSON value per line, written and
+read line by line:
+
+    MAGIC
+    ["fixtures", count]    then one [manufacturer, model, mode] per line
+    ["patch", count]       then one [channel, output, universe, fixture index,
+                           parameters values] per line
+    ["submasters", count]  then one [index, inhibitive, look] per line
+    ["cues", count]        then one cue moves per line
+    ["index", cues]        [offset, number, up, down, delay] of each cue
+    offset of index line
+
+Fixtures are stored by reference and found again in the fixtures library.
+Looks and moves are lists of [channel, parameter name, value].
+Cues moves are only read when needed, using the index at the end of file.
+"""
+import json
+import os
+
+from nino.defines import App
+from nino.device import Device
+from nino.playback import Cue
+from nino.tab_patch import get_fixture
+
+MAGIC = "NINO SHOW 1"
+
+
+def save_show(path):
+    """Save show
+
+    The show is written in a temporary file, which then replaces the old one.
+
+    Args:
+        path (str): show file
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as show:
+        _write(show, MAGIC)
+        _write_patch(show)
+        bank = App().submasters.bank
+        recorded = [i for i, submaster in enumerate(bank) if submaster.look]
+        _write(show, ["submasters", len(recorded)])
+        for index in recorded:
+            submaster = bank[index]
+            _write(show, [index, submaster.inhibitive, levels_to_rows(submaster.look)])
+        cues = App().cue_list.cues
+        _write(show, ["cues", len(cues)])
+        index = []
+        for cue in cues:
+            index.append([show.tell(), cue.number, cue.up, cue.down, cue.delay])
+            _write(show, levels_to_rows(cue.moves))
+        offset = show.tell()
+        _write(show, ["index", index])
+        _write(show, offset)
+    os.replace(temp_path, path)
+
+
+def _write_patch(show):
+    """Write fixtures and patch sections
+
+    Args:
+        show (file): show file
+    """
+    fixtures = {}
+    for devices in App().patch.channels.values():
+        for device in devices.values():
+            fixtures.setdefault(fixture_key(device.fixture), len(fixtures))
+    _write(show, ["fixtures", len(fixtures)])
+    for key in fixtures:
+        _write(show, list(key))
+    rows = sum(len(devices) for devices in App().patch.channels.values())
+    _write(show, ["patch", rows])
+    for channel, devices in sorted(App().patch.channels.items()):
+        for device in devices.values():
+            _write(
+                show,
+                [
+                    channel,
+                    device.output,
+                    device.universe,
+                    fixtures[fixture_key(device.fixture)],
+                    list(device.parameters.values()),
+                ],
+            )
+
+
+def load_show(path):
+    """Load show
+
+    Args:
+        path (str): show file
+
+    Returns:
+        True if loaded
+    """
+    # The whole file is read and checked before changing anything
+    try:
+        channels, submasters, index = _read_show(path)
+        cues = [
+            Cue(
+                number,
+                None,
+                up=up,
+                down=down,
+                delay=delay,
+                loader=_cue_loader(path, offset),
+            )
+            for offset, number, up, down, delay in index
+        ]
+    except (OSError, ValueError, KeyError, TypeError, IndexError) as error:
+        print(f"Can't open {path}: {error}")
+        return False
+    _apply(channels, submasters, cues)
+    return True
+
+
+def _read_show(path):
+    """Read show file, except cues moves
+
+    Args:
+        path (str): show file
+
+    Raises:
+        ValueError: not a show file, or unknown fixture
+        KeyError, TypeError, IndexError: malformed show file
+
+    Returns:
+        patch, (index, inhibitive, look) of recorded submasters and cues index
+    """
+    with open(path, "rb") as show:
+        if _read(show) != MAGIC:
+            raise ValueError("not a show file")
+        channels = _read_patch(show)
+        submasters = []
+        for index, inhibitive, look in _read_section(show, "submasters"):
+            if not 0 <= index < len(App().submasters.bank):
+                raise IndexError(f"Submaster {index + 1} doesn't exist")
+            submasters.append((index, bool(inhibitive), rows_to_levels(look)))
+        show.seek(-32, os.SEEK_END)
+        offset = int(show.read().splitlines()[-1])
+        show.seek(offset)
+        _name, index = _read(show)
+    return channels, submasters, index
+
+
+def _read_patch(show):
+    """Read fixtures and patch sections
+
+    Args:
+        show (file): show file
+
+    Raises:
+        ValueError: unknown fixture
+
+    Returns:
+        patch, devices by output and universe by channel
+    """
+    fixtures = [find_fixture(*key) for key in _read_section(show, "fixtures")]
+    channels = {}
+    for channel, output, universe, fixture, values in _read_section(show, "patch"):
+        device = new_device(channel, output, universe, fixtures[fixture], values)
+        channels.setdefault(channel, {})[f"{output}.{universe}"] = device
+    return channels
+
+
+def _apply(channels, submasters, cues):
+    """Replace current show
+
+    Args:
+        channels (dict): patch
+        submasters (list): (index, inhibitive, look) of recorded submasters
+        cues (list): cues
+    """
+    App().undo_manager.clear()
+    # Release all levels of previous show
+    App().stop_replay()
+    App().effects.stop_all()
+    App().cue_list.load(cues)
+    App().dmx.sources["programmer"].frames.clear()
+    for frame in App().dmx.ltp.values():
+        frame[:] = bytes(512)
+    App().patch.replace(channels)
+    for widget in App().tabs.get("live").channels:
+        widget.devices = list(channels.get(widget.channel, {}).values())
+    App().patch.update_views()
+    for devices in channels.values():
+        for device in devices.values():
+            device.send_dmx()
+    for index in range(len(App().submasters.bank)):
+        App().submasters.record(index, {})
+    for index, inhibitive, look in submasters:
+        App().submasters.record(index, look, inhibitive)
+    App().playback.cue_list_view.update_view()
+    App().playback.submasters_view.update_view()
+    for universe in App().dmx.levels:
+        App().dmx.set_dirty(universe)
+
+
+def _cue_loader(path, offset):
+    """Create a function reading moves of a cue
+
+    Args:
+        path (str): show file
+        offset (int): position of cue in file
+
+    Returns:
+        function
+    """
+
+    def loader():
+        with open(path, "rb") as show:
+            show.seek(offset)
+            return rows_to_levels(_read(show))
+
+    return loader
+
+
+def new_device(channel, output, universe, fixture, values):
+    """Create a device with saved parameters values
+
+    Args:
+        channel (int): Channel [1 - MAX_CHANNELS]
+        output (int): Output [1 - 512]
+        universe (int): Universe
+        fixture (Fixture): fixture
+        values (list): parameters values, in device parameters order
+
+    Returns:
+        Device
+    """
+    device = Device(channel, output, universe, fixture)
+    device.parameters = dict(zip(device.parameters, values))
+    if device.virtual_intensity is not None:
+        param = device.fixture.parameters["Intensity"]
+        maxi = param.get("range").get("Maximum")
+        device.virtual_intensity = device.parameters["Intensity"] / maxi
+    return device
+
+
+def find_fixture(manufacturer, model, mode):
+    """Find a fixture in the show or in the library
+
+    Args:
+        manufacturer (str): manufacturer name
+        model (str): model name
+        mode (str): mode name
+
+    Raises:
+        ValueError: fixture not in library
+
+    Returns:
+        Fixture
+    """
+    for fixture in App().fixtures:
+        if fixture_key(fixture) == (manufacturer, model, mode):
+            return fixture
+    fixture = get_fixture(manufacturer=manufacturer, model=model, mode=mode)
+    if fixture_key(fixture) != (manufacturer, model, mode):
+        raise ValueError(f"Unknown fixture {manufacturer} {model} {mode}")
+    App().fixtures.append(fixture)
+    return fixture
+
+
+def fixture_key(fixture):
+    """Fixture reference
+
+    Args:
+        fixture (Fixture): fixture
+
+    Returns:
+        (manufacturer, model name, mode name)
+    """
+    return (fixture.manufacturer, fixture.model_name, fixture.mode.get("name"))
+
+
+def levels_to_rows(levels):
+    """Levels to compact rows
+
+    Args:
+        levels (dict): values by (channel, parameter name)
+
+    Returns:
+        list of [channel, parameter name, value]
+    """
+    return [[channel, name, value] for (channel, name), value in levels.items()]
+
+
+def rows_to_levels(rows):
+    """Compact rows to levels
+
+    Args:
+        rows (list): [channel, parameter name, value]
+
+    Returns:
+        dict of values by (channel, parameter name)
+    """
+    return {(channel, name): value for channel, name, value in rows}
+
+
+def _write(show, value):
+    """Write one line
+
+    Args:
+        show (file): show file
+        value: JSON value
+    """
+    show.write(json.dumps(value, separators=(",", ":")).encode() + b"\n")
+
+
+def _read(show):
+    """Read one line
+
+    Args:
+        show (file): show file
+
+    Returns:
+        JSON value
+    """
+    return json.loads(show.readline())
+
+
+def _read_section(show, name):
+    """Read lines of a section
+
+    Args:
+        show (file): show file
+        name (str): expected section name
+
+    Yields:
+        JSON values
+    """
+    section, count = _read(show)
+    if section != name:
+        raise ValueError(f"Section '{name}' expected, found '{section}'")
+    for _i in range(count):
+        yield _read(show)
@@ -22,4 +22,6 @@ gsignals = {
     "minus": (GObject.SignalFlags.ACTION, None, ()),
     "at_level": (GObject.SignalFlags.ACTION, None, ()),
     "offset": (GObject.SignalFlags.ACTION, None, ()),
+    "autopatch": (GObject.SignalFlags.ACTION, None, ()),
+    "effect": (GObject.SignalFlags.ACTION, None, ()),
 }
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# niño
+# Copyright (c) 2020-2021 Mika Cousin <mika.cousin@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Submasters.
+
+A submaster stores a look, compiled to one dense frame of HTP levels per
+universe. Moving faders only stores levels: at next output tick, each
+modified universe is mixed once, frames being scaled with translation tables
+and merged with one maximum (proportional) or one minimum (inhibitive).
+16-bit slots are scaled on their whole value, then split in two bytes.
+"""
+import threading
+
+from gi.repository import GLib
+
+from nino.defines import App
+from nino.merge import NO_LEVELS
+
+SUBMASTERS = 10
+# Translation tables scaling a byte by level / 255
+SCALE = [bytes(value * level // 255 for value in range(256)) for level in range(256)]
+# Translation table giving 255 for 0 and 0 for other values
+INVERT = bytes([255]) + NO_LEVELS[:255]
+
+
+class Submaster:
+    """A submaster
+
+    Attributes:
+        look (dict): values by (channel, parameter name)
+        level (int): fader level [0 - 255]
+        inhibitive (bool): limits output instead of adding levels
+        frames (dict): look HTP levels by universe
+        outside (dict): 255 on slots not in look, 0 on slots in look, by universe
+        wide (dict): (high byte slot, low byte slot, level) of 16-bit slots, by
+            universe
+    """
+
+    def __init__(self, look=None, inhibitive=False):
+        self.look = look or {}
+        self.level = 0
+        self.inhibitive = inhibitive
+        self.frames = {}
+        self.outside = {}
+        self.wide = {}
+
+    def compile(self):
+        """Compile look to output frames, only HTP slots are used"""
+        frames = {}
+        inside = {}
+        wide = {}
+        for (channel, name), value in self.look.items():
+            for device in App().patch.channels.get(channel, {}).values():
+                if not device.output:
+                    continue
+                frame = frames.setdefault(device.universe, bytearray(512))
+                mask = inside.setdefault(device.universe, bytearray(512))
+                for high, low, level in self._slots(device, name, value):
+                    mask[high] = 255
+                    if low is None:
+                        frame[high] = level
+                    else:
+                        mask[low] = 255
+                        wide.setdefault(device.universe, []).append((high, low, level))
+        self.frames = {universe: bytes(frame) for universe, frame in frames.items()}
+        self.outside = {
+            universe: bytes(mask).translate(INVERT) for universe, mask in inside.items()
+        }
+        self.wide = wide
+
+    def _slots(self, device, name, value):
+        """HTP slots of a device parameter
+
+        Args:
+            device (Device): patched device
+            name (str): parameter name
+            value (int): parameter value in look
+
+        Yields:
+            (high byte slot, low byte slot or None, level)
+        """
+        virtual_intensity = None
+        if device.virtual_intensity is not None:
+            param = device.fixture.parameters["Intensity"]
+            maxi = param.get("range").get("Maximum")
+            virtual_intensity = self.look.get((device.channel, "Intensity"), 0) / maxi
+        for param, high, low, scaled, htp in device.slots:
+            if param != name or not htp:
+                continue
+            level = value
+            if scaled and virtual_intensity is not None:
+                level = int(value * virtual_intensity)
+            yield high, low, level
+
+    def scaled(self, universe):
+        """Look levels of a universe scaled by fader level
+
+        Args:
+            universe (int): universe
+
+        Returns:
+            bytes of 512 levels
+        """
+        frame = self.frames[universe].translate(SCALE[self.level])
+        wide = self.wide.get(universe)
+        if not wide:
+            return frame
+        frame = bytearray(frame)
+        for high, low, level in wide:
+            level = level * self.level // 255
+            frame[high] = level >> 8
+            frame[low] = level & 0xFF
+        return bytes(frame)
+
+    def limits(self, universe):
+        """Maximum levels allowed by an inhibitive submaster
+
+        Args:
+            universe (int): universe
+
+        Returns:
+            bytes of 512 levels, 255 on slots not in look
+        """
+        return bytes(map(max, self.scaled(universe), self.outside[universe]))
+
+
+class Submasters:
+    """Bank of submasters, mixed by output thread
+
+    Attributes:
+        dmx (DMX): DMX levels
+        source (Source): merge source of proportional submasters
+        bank (list): submasters
+        dirty (set): universes to mix at next tick
+        compiling (bool): looks compilation is pending
+    """
+
+    def __init__(self, dmx, source):
+        self.dmx = dmx
+        self.source = source
+        self.bank = [Submaster() for _i in range(SUBMASTERS)]
+        self.dirty = set()
+        self.compiling = False
+        self.lock = threading.Lock()
+
+    def record(self, index, look, inhibitive=False):
+        """Store a look in a submaster, keep fader level
+
+        Args:
+            index (int): submaster index
+            look (dict): values by (channel, parameter name)
+            inhibitive (bool): limits output instead of adding levels
+        """
+        submaster = Submaster(look, inhibitive)
+        submaster.compile()
+        with self.lock:
+            old = self.bank[index]
+            submaster.level = old.level
+            self.bank[index] = submaster
+            self.dirty.update(old.frames, submaster.frames)
+
+    def set_level(self, index, level):
+        """Move a fader, may be called from any thread
+
+        Args:
+            index (int): submaster index
+            level (int): [0 - 255]
+        """
+        with self.lock:
+            submaster = self.bank[index]
+            submaster.level = min(max(int(level), 0), 255)
+            self.dirty.update(submaster.frames)
+
+    def set_inhibitive(self, index, inhibitive):
+        """Change submaster mode
+
+        Args:
+            index (int): submaster index
+            inhibitive (bool): limits output instead of adding levels
+        """
+        with self.lock:
+            submaster = self.bank[index]
+            submaster.inhibitive = inhibitive
+            self.dirty.update(submaster.frames)
+
+    def invalidate(self):
+        """Patch changed, compile looks again in GTK thread"""
+        if not self.compiling:
+            self.compiling = True
+            GLib.idle_add(self._compile)
+
+    def _compile(self):
+        """Compile all looks
+
+        Returns:
+            False to stop idle callback
+        """
+        self.compiling = False
+        with self.lock:
+            for submaster in self.bank:
+                old = set(submaster.frames)
+                submaster.compile()
+                self.dirty.update(old, submaster.frames)
+        return False
+
+    def tick(self, _now):
+        """Mix modified universes, called by output thread"""
+        with self.lock:
+            dirty = self.dirty
+            self.dirty = set()
+            for universe in dirty:
+                self._mix(universe)
+        for universe in dirty:
+            self.dmx.set_dirty(universe)
+
+    def _mix(self, universe):
+        """Mix submasters of a universe
+
+        Args:
+            universe (int): universe
+        """
+        frames = [
+            submaster.scaled(universe)
+            for submaster in self.bank
+            if submaster.level
+            and not submaster.inhibitive
+            and universe in submaster.frames
+        ]
+        if not frames:
+            self.source.frames.pop(universe, None)
+        elif len(frames) == 1:
+            self.source.frame(universe)[:] = frames[0]
+        else:
+            self.source.frame(universe)[:] = bytes(map(max, *frames))
+        limits = [
+            submaster.limits(universe)
+            for submaster in self.bank
+            if submaster.inhibitive and universe in submaster.frames
+        ]
+        if not limits:
+            self.dmx.inhibit.pop(universe, None)
+        elif len(limits) == 1:
+            self.dmx.inhibit[universe] = limits[0]
+        else:
+            self.dmx.inhibit[universe] = bytes(map(min, *limits))
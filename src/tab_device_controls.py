@@ -183,6 +183,19 @@ class TabDeviceControls(Gtk.ScrolledWindow):
             device.parameters[widget.parameter] = widget.get_value_as_int()
             device.send_dmx()
 
+    def get_universes(self):
+        """Universes of displayed devices
+
+        Returns:
+            set of universes
+        """
+        universes = set()
+        for group in self.stacks.values():
+            for devices in group.get("parameters").values():
+                for device in devices:
+                    universes.add(device.universe)
+        return universes
+
     def update_view(self):
         """Update view on parameters change"""
         for param in self.stacks:
@@ -11,9 +11,13 @@
 # GNU General Public License for more details.
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
+import time
+from gettext import gettext as _
+
 from gi.repository import Gtk
 
 from nino.defines import App, MAX_CHANNELS
+from nino.effects import Effect
 from nino.signals import gsignals
 from nino.widgets_channel import ChannelWidget
 
@@ -32,6 +36,7 @@ class TabLive(Gtk.ScrolledWindow):
         self.connect("plus", self.plus)
         self.connect("minus", self.minus)
         self.connect("at_level", self.at_level)
+        self.connect("effect", self.effect)
 
         self.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
 
@@ -152,6 +157,31 @@ class TabLive(Gtk.ScrolledWindow):
                     device.send_dmx()
         App().statusbar_remove_all()
 
+    def effect(self, _widget):
+        """Effect signal, start or stop an intensity chase on selected channels
+
+        Keystring gives the chase rate in cycles per second, 1 by default.
+        """
+        channels = [
+            flowboxchild.get_children()[0].channel
+            for flowboxchild in self.flowbox.get_selected_children()
+        ]
+        running = App().effects.find(channels, "Intensity")
+        if running:
+            App().effects.stop(running)
+        elif channels:
+            rate = 1.0
+            if App().keystring and App().keystring.replace(".", "", 1).isdigit():
+                rate = float(App().keystring)
+            effect = Effect(channels, "Intensity", rate=rate, spread=360.0)
+            App().effects.start(effect, time.monotonic())
+            if not effect.targets:
+                App().effects.stop(effect)
+                App().statusbar_remove_all()
+                App().statusbar_push(_("No intensity or color to move"))
+                return
+        App().statusbar_remove_all()
+
 
 def filter_channels(child, _user_data):
     """Display only patched channels
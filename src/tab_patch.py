@@ -18,8 +18,9 @@ from gettext import gettext as _
 from gi.repository import Gtk
 
 import nino.shortcuts as shortcuts
-from nino.console import Fixture
-from nino.defines import App, MAX_CHANNELS, UNIVERSES
+from nino.autopatch import auto_patch
+from nino.defines import App, MAX_CHANNELS
+from nino.fixture import Fixture
 from nino.paths import get_fixtures_dir
 from nino.signals import gsignals
 from nino.widgets_output import OutputWidget
@@ -334,50 +335,82 @@ class Fixtures(Gtk.ScrolledWindow):
 
 
 class SacnWidget(Gtk.ScrolledWindow):
-    """sACN View Widget"""
+    """sACN View Widget
+
+    Universes are only displayed when they are in use.
+
+    Attributes:
+        outputs (dict): OutputWidget by universe and output
+        universes (dict): Gtk.FlowBox by displayed universe
+        labels (dict): Gtk.Label by displayed universe
+    """
 
     def __init__(self):
         Gtk.ScrolledWindow.__init__(self)
         self.set_vexpand(True)
         self.set_hexpand(True)
-        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-        flowbox = []
+        self.vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
         self.outputs = {}
-        for univ in UNIVERSES:
-            vbox.pack_start(
-                Gtk.Label(label=_("Universe {}").format(univ)), True, True, 0
-            )
-            flowbox.append(Gtk.FlowBox())
-            flowbox[-1].set_valign(Gtk.Align.START)
-            flowbox[-1].set_max_children_per_line(512)
-            flowbox[-1].set_selection_mode(Gtk.SelectionMode.NONE)
-            for output in range(512):
-                self.outputs[univ, output] = OutputWidget(univ, output + 1)
-                flowbox[-1].add(self.outputs[univ, output])
-            vbox.pack_start(flowbox[-1], True, True, 0)
-        for flow in flowbox:
-            for child in flow.get_children():
-                child.set_name("flowbox_outputs")
-        self.add(vbox)
+        self.universes = {}
+        self.labels = {}
+        self.add(self.vbox)
+        self.update_view()
+
+    def add_universe(self, univ):
+        """Display a universe
+
+        Args:
+            univ (int): universe
+        """
+        label = Gtk.Label(label=_("Universe {}").format(univ))
+        flowbox = Gtk.FlowBox()
+        flowbox.set_valign(Gtk.Align.START)
+        flowbox.set_max_children_per_line(512)
+        flowbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        for output in range(512):
+            self.outputs[univ, output] = OutputWidget(univ, output + 1)
+            flowbox.add(self.outputs[univ, output])
+        for child in flowbox.get_children():
+            child.set_name("flowbox_outputs")
+        self.universes[univ] = flowbox
+        self.labels[univ] = label
+        # Keep universes sorted
+        position = sorted(self.universes).index(univ) * 2
+        self.vbox.pack_start(label, True, True, 0)
+        self.vbox.reorder_child(label, position)
+        self.vbox.pack_start(flowbox, True, True, 0)
+        self.vbox.reorder_child(flowbox, position + 1)
+        self.vbox.show_all()
+
+    def remove_universe(self, univ):
+        """Stop displaying a universe
+
+        Args:
+            univ (int): universe
+        """
+        self.labels.pop(univ).destroy()
+        self.universes.pop(univ).destroy()
+        for output in range(512):
+            del self.outputs[univ, output]
 
     def update_view(self):
         """Update sACN view"""
-        for widget in self.outputs.values():
-            widget.channel = 0
-            widget.queue_draw()
-        for output in App().patch.channels.values():
-            for device in output.values():
-                if device.output:
-                    for offset in range(device.footprint):
-                        self.outputs[
-                            device.universe, device.output - 1 + offset
-                        ].channel = device.channel
-                        self.outputs[
-                            device.universe, device.output - 1 + offset
-                        ].key = f"{device.output}.{device.universe}"
-                        self.outputs[
-                            device.universe, device.output - 1 + offset
-                        ].queue_draw()
+        universes = set(App().active_universes)
+        if App().universes:
+            universes.add(App().universes[0])
+        for univ in sorted(set(self.universes) - universes):
+            self.remove_universe(univ)
+        for univ in sorted(universes - set(self.universes)):
+            self.add_universe(univ)
+        # Read devices from the patch occupancy, without walking all channels
+        for univ in self.universes:
+            owners = App().patch.occupancy.get(univ) or [None] * 512
+            for output, device in enumerate(owners):
+                widget = self.outputs[univ, output]
+                widget.channel = device.channel if device else 0
+                if device:
+                    widget.key = f"{device.output}.{device.universe}"
+                widget.queue_draw()
 
 
 class TabPatch(Gtk.Box):
@@ -400,6 +433,7 @@ class TabPatch(Gtk.Box):
         self.connect("insert", self.insert)
         self.connect("thru", self.thru)
         self.connect("offset", self.set_offset)
+        self.connect("autopatch", self.autopatch)
 
         # Paned container
         paned = Gtk.Paned(orientation=Gtk.Orientation.HORIZONTAL)
@@ -502,7 +536,6 @@ class TabPatch(Gtk.Box):
             App().statusbar_remove_all()
             return
         model, selected_channels = self.treeview.get_selection().get_selected_rows()
-        footprint = 0
         if not verify_fixture(model, selected_channels):
             dialog = Gtk.MessageDialog(
                 transient_for=self.window,
@@ -514,6 +547,33 @@ class TabPatch(Gtk.Box):
             dialog.run()
             dialog.destroy()
             return
+        patches = self._patches(model, selected_channels, output, universe)
+        if patches is None:
+            App().statusbar_remove_all()
+            return
+        # One undo step and one update for the whole patch, collisions included
+        changed = App().patch.patch_many(patches) if patches else []
+        update_channels_rows(changed, model)
+        # Reset offset
+        self.offset = 0
+        # Update sACN View
+        self.sacn.update_view()
+        App().statusbar_remove_all()
+
+    def _patches(self, model, selected_channels, output, universe):
+        """Patches of selected channels from entered output
+
+        Args:
+            model (Gtk.ListStore): patch model
+            selected_channels (list): paths of selected rows
+            output (int): first output, 0 to depatch, None to keep outputs
+            universe (int): universe
+
+        Returns:
+            (channel, output, universe, fixture) tuples, None if a channel
+            has no output to keep
+        """
+        patches = []
         for i, path in enumerate(selected_channels):
             fixture = get_fixture_by_name(model, path)
             footprint = fixture.get_footprint()
@@ -527,29 +587,48 @@ class TabPatch(Gtk.Box):
                 if real_output + footprint > 513:
                     # If device outputs over 512, stop patching
                     break
-                # Test if output already used
-                self.test_outputs_collision(real_output, universe, footprint, model)
             elif output is None:
                 # Universe change, no Output in entry. So, try to find one
                 for out in App().patch.channels[channel].values():
                     real_output = out.output
                     if not real_output:
-                        App().statusbar_remove_all()
-                        return
+                        return None
             else:
                 # Depatch
                 real_output = 0
-            App().patch.patch_channel(channel, real_output, universe, fixture)
-            # Update Channels list
-            update_channels_list(
-                f"{real_output}.{universe}", footprint, channel, model, path
-            )
-        # Reset offset
-        self.offset = 0
-        # Update sACN View
+            patches.append((channel, real_output, universe, fixture))
+        return patches
+
+    def autopatch(self, _widget):
+        """Auto patch signal, patch selected channels on free outputs"""
+        model, selected_channels = self.treeview.get_selection().get_selected_rows()
+        devices = [
+            (model[path][0], get_fixture_by_name(model, path))
+            for path in selected_channels
+        ]
+        if not devices:
+            App().statusbar_remove_all()
+            return
+        changed, unplaced = auto_patch(
+            devices,
+            App().settings.autopatch_strategy,
+            App().settings.autopatch_split,
+        )
+        update_channels_rows(changed, model)
         self.sacn.update_view()
-        App().tabs.get("live").flowbox.invalidate_filter()
         App().statusbar_remove_all()
+        if unplaced:
+            dialog = Gtk.MessageDialog(
+                transient_for=self.window,
+                flags=0,
+                message_type=Gtk.MessageType.INFO,
+                buttons=Gtk.ButtonsType.OK,
+                text=_("No free outputs for channels {}").format(
+                    ", ".join(str(channel) for channel in unplaced)
+                ),
+            )
+            dialog.run()
+            dialog.destroy()
 
     def test_outputs_collision(self, output, universe, footprint, model):
         """Test if outputs are already used
@@ -561,24 +640,15 @@ class TabPatch(Gtk.Box):
             model (Gtk.TreeModel): Channels list model
         """
         depatch = []
-        device = None
-        for out in App().patch.channels.values():
-            for device in out.values():
-                if device.output and (
-                    set(range(output, output + footprint))
-                    & set(range(device.output, device.output + device.footprint))
-                    and universe == device.universe
-                ):
-                    # Remove old patched devices
-                    path = Gtk.TreePath.new_from_indices([device.channel - 1])
-                    for offset in range(device.footprint):
-                        self.sacn.outputs[
-                            device.universe, device.output - 1 + offset
-                        ].channel = 0
-                        self.sacn.outputs[
-                            device.universe, device.output - 1 + offset
-                        ].queue_draw()
-                    depatch.append(device.channel)
+        last = output + footprint - 1
+        for device in App().patch.occupants(universe, output, last):
+            # Remove old patched devices
+            for offset in range(device.footprint):
+                widget = self.sacn.outputs[device.universe, device.output - 1 + offset]
+                widget.channel = 0
+                widget.queue_draw()
+            if device.channel not in depatch:
+                depatch.append(device.channel)
         if depatch:
             for channel in depatch:
                 App().patch.patch_channel(channel, 0, universe, None)
@@ -619,8 +689,9 @@ class TabPatch(Gtk.Box):
         if output + footprint > 513:
             App().statusbar_remove_all()
             return
-        self.test_outputs_collision(output, universe, footprint, model)
-        App().patch.insert_output(channel, output, universe, fixture)
+        with App().patch.transaction():
+            self.test_outputs_collision(output, universe, footprint, model)
+            App().patch.insert_output(channel, output, universe, fixture)
         # Update Channels list
         update_channels_list(f"{output}.{universe}", footprint, channel, model, path)
         # Update sACN View
@@ -645,8 +716,9 @@ def update_channels_list(out, footprint, channel, model, path):
     if not output or channel not in App().patch.channels:
         model[path][1] = ""
         return
+    first = App().universes[0] if App().universes else None
     for device in App().patch.channels[channel].values():
-        univ = f".{device.universe}" if device.universe != UNIVERSES[0] else ""
+        univ = f".{device.universe}" if device.universe != first else ""
         if footprint > 1:
             text.append(f"{device.output}{univ}-{device.output + footprint - 1}{univ}")
         else:
@@ -658,6 +730,23 @@ def update_channels_list(out, footprint, channel, model, path):
     model[path][2] = _get_fixture_name(device)
 
 
+def update_channels_rows(channels, model):
+    """Update rows of modified channels in Channels list
+
+    Args:
+        channels (list): modified channels
+        model (Gtk.TreeModel): model
+    """
+    for channel in channels:
+        path = Gtk.TreePath.new_from_indices([channel - 1])
+        devices = list(App().patch.channels.get(channel, {}).values())
+        if devices:
+            out = f"{devices[0].output}.{devices[0].universe}"
+            update_channels_list(out, devices[0].footprint, channel, model, path)
+        else:
+            update_channels_list("0.0", 0, channel, model, path)
+
+
 def _get_fixture_name(device):
     """Get fixture name for Channels list.
 
@@ -736,8 +825,8 @@ def parse_entry(text):
     else:
         # Output in first universe
         output = int(text)
-        universe = UNIVERSES[0]
-    if universe not in UNIVERSES:
+        universe = App().universes[0] if App().universes else 0
+    if universe not in App().universes:
         universe = 0
     return output, universe
 
@@ -13,6 +13,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """Undo / Redo functionality for arbitrary classes."""
+import collections
+import contextlib
+import sys
 
 
 class EmptyCommandStackError(Exception):
@@ -30,11 +33,28 @@ class UndoManager:
             undo_mgr.undo()
         if undo_mgr.can_redo():
             undo_mgr.redo()
+
+    Commands done in a transaction are undone and redone in one step:
+        with undo_mgr.transaction():
+            undo_mgr.do(Command(params...))
+            undo_mgr.do(Command(params...))
+
+    When the history is deeper than its depth or uses more memory than its
+    budget, oldest steps are forgotten.
+
+    Attributes:
+        depth (int): maximum number of undo steps, None for no limit
+        budget (int): maximum memory of restore points in bytes, None for no
+            limit. The last step is always kept.
     """
 
-    def __init__(self):
-        self._undo_stack = []
+    def __init__(self, depth=None, budget=None):
+        self.depth = depth
+        self.budget = budget
+        self._undo_stack = collections.deque()
         self._redo_stack = []
+        self._group = None
+        self._depth = 0
 
     def do(self, command):
         """Execute command and manages undo / redo stacks.
@@ -46,8 +66,83 @@ class UndoManager:
             command result
         """
         self._redo_stack.clear()
-        self._undo_stack.append(command)
-        return command.do()
+        result = command.do()
+        if self._group is not None:
+            self._group.commands.append(command)
+        else:
+            self._push(command)
+        return result
+
+    def _push(self, step):
+        """Add an undo step, forget oldest steps over limits
+
+        Args:
+            step (Command or CommandGroup): step
+        """
+        self._undo_stack.append(step)
+        if self.depth is not None:
+            while len(self._undo_stack) > self.depth:
+                self._undo_stack.popleft()
+        if self.budget is not None:
+            memory = self.memory()
+            while memory > self.budget and len(self._undo_stack) > 1:
+                memory -= self._undo_stack.popleft().size
+
+    def begin(self):
+        """Start a transaction, transactions may be nested"""
+        if self._depth == 0:
+            self._group = CommandGroup()
+        self._depth += 1
+
+    def commit(self):
+        """End a transaction, outermost one adds its commands as one step"""
+        self._depth -= 1
+        if self._depth == 0:
+            group = self._group
+            self._group = None
+            if group.commands:
+                self._push(group)
+
+    def memory(self):
+        """Memory used by restore points
+
+        Returns:
+            estimated size in bytes
+        """
+        return sum(step.size for step in self._undo_stack) + sum(
+            step.size for step in self._redo_stack
+        )
+
+    def report(self):
+        """Memory used by each undo step
+
+        Returns:
+            list of (step name, estimated size in bytes), oldest step first
+        """
+        return [(step.name, step.size) for step in self._undo_stack]
+
+    @property
+    def in_transaction(self):
+        """Is a transaction open ?
+
+        Returns:
+            True: Yes, False: No
+        """
+        return self._depth > 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group commands done in the block in one undo step"""
+        self.begin()
+        try:
+            yield
+        finally:
+            self.commit()
+
+    def clear(self):
+        """Forget all commands"""
+        self._undo_stack.clear()
+        self._redo_stack.clear()
 
     def can_undo(self):
         """Is undo possible ?
@@ -79,8 +174,9 @@ class UndoManager:
         command = self._undo_stack.pop()
         self._redo_stack.append(command)
         result = command.undo()
-        func = getattr(command.obj, "undo", None)
-        func()
+        for obj in command.objects:
+            func = getattr(obj, "undo", None)
+            func()
         return result
 
     def redo(self):
@@ -97,8 +193,9 @@ class UndoManager:
         command = self._redo_stack.pop()
         self._undo_stack.append(command)
         result = command.do()
-        func = getattr(command.obj, "redo", None)
-        func()
+        for obj in command.objects:
+            func = getattr(obj, "redo", None)
+            func()
         return result
 
 
@@ -109,16 +206,18 @@ class Command:
         """Create a Command by passing an object, a method to call on the object,
         and a variable number of arguments to pass to the method.
 
-        The object must support methods .copy() and .restore(obj).
-        - copy() returns a copy of the object
-        - restore(obj) restores the calling object to the state of the passed object
+        The object must support methods .copy(*args) and .restore(restore_point).
+        - copy(*args) returns what the method called with args will change
+        - restore(restore_point) puts it back
+        It may support .sizeof(restore_point, *args), returning the memory kept
+        by the restore point.
 
         These methods allow undo to work properly.
 
         Args:
             obj: object to call the method on
             do_method: method to call
-            args: arguments to pass to the method
+            args: arguments to pass to the method, first one is the target
         """
         assert hasattr(obj, "copy")
         assert hasattr(obj, "restore")
@@ -127,14 +226,32 @@ class Command:
         self.args = list(args)
 
         self.restore_point = None
+        self.size = 0
+
+    @property
+    def name(self):
+        """Command name
+
+        Returns:
+            method name and target, or number of targets
+        """
+        target = self.args[0] if self.args else ""
+        if isinstance(target, list):
+            target = f"({len(target)})"
+        return f"{self.do_method.__name__} {target}"
 
     def do(self):
-        """Set a restore point (copy the object), then call the method.
+        """Set a restore point (save what will change), then call the method.
 
         Returns:
             obj.do_method(*args)
         """
-        self.restore_point = self.obj.copy()
+        self.restore_point = self.obj.copy(*self.args)
+        sizeof = getattr(self.obj, "sizeof", None)
+        if sizeof:
+            self.size = sizeof(self.restore_point, *self.args)
+        else:
+            self.size = sys.getsizeof(self.restore_point)
         return self.do_method(self.obj, *self.args)
 
     def undo(self):
@@ -145,6 +262,79 @@ class Command:
         """
         return self.obj.restore(self.restore_point)
 
+    @property
+    def objects(self):
+        """Objects to refresh after undo or redo
+
+        Returns:
+            list of objects
+        """
+        return [self.obj]
+
+
+class CommandGroup:
+    """Commands undone and redone together
+
+    Attributes:
+        commands (list): commands in execution order
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    @property
+    def name(self):
+        """Group name
+
+        Returns:
+            number of commands
+        """
+        return f"{len(self.commands)} commands"
+
+    @property
+    def size(self):
+        """Memory used by restore points
+
+        Returns:
+            estimated size in bytes
+        """
+        return sum(command.size for command in self.commands)
+
+    def do(self):
+        """Do all commands
+
+        Returns:
+            last command result
+        """
+        result = None
+        for command in self.commands:
+            result = command.do()
+        return result
+
+    def undo(self):
+        """Undo all commands, last one first
+
+        Returns:
+            first command result
+        """
+        result = None
+        for command in reversed(self.commands):
+            result = command.undo()
+        return result
+
+    @property
+    def objects(self):
+        """Objects to refresh after undo or redo, each one once
+
+        Returns:
+            list of objects
+        """
+        objects = []
+        for command in self.commands:
+            if command.obj not in objects:
+                objects.append(command.obj)
+        return objects
+
 
 def undoable(func):
     """Decorator to allow an instance method to be undone.
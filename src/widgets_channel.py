@@ -135,6 +135,12 @@ class ChannelWidget(Gtk.Misc):
         cr.set_font_size(13 * self.scale)
         cr.move_to(6 * self.scale, 48 * self.scale)
         level = self.devices[0].parameters.get("Intensity")
+        # sACN input is merged HTP
+        input_level = (
+            App().dmx.sources["input"].device_level(self.devices[0], "Intensity")
+        )
+        if input_level and input_level > level:
+            level = input_level
         if level:
             maxi = (
                 self.devices[0]
@@ -11,14 +11,20 @@
 # GNU General Public License for more details.
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
+from gettext import gettext as _
 from gi.repository import Gio, Gtk
 
+from nino.defines import App
+from nino.submasters import SUBMASTERS
+
 
 class PlaybackWindow(Gtk.ApplicationWindow):
     """niño's main playback window.
 
     Attributes:
         app (Nino): Application
+        cue_list_view (CueListView): main playback cues
+        submasters_view (SubmastersView): submasters faders
     """
 
     def __init__(self, app):
@@ -43,12 +49,11 @@ class PlaybackWindow(Gtk.ApplicationWindow):
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
 
         self.notebook = Gtk.Notebook()
-        scrolled = Gtk.ScrolledWindow()
-        scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
-        label = Gtk.Label("Main Playback")
-        scrolled.add(label)
-        self.notebook.append_page(scrolled, Gtk.Label("Playback"))
+        self.cue_list_view = CueListView()
+        self.notebook.append_page(self.cue_list_view, Gtk.Label("Playback"))
         vbox.pack_start(self.notebook, True, True, 0)
+        self.submasters_view = SubmastersView()
+        vbox.pack_start(self.submasters_view, False, False, 0)
 
         self.statusbar = Gtk.Statusbar()
         self.context_id = self.statusbar.get_context_id("keypress")
@@ -57,3 +62,92 @@ class PlaybackWindow(Gtk.ApplicationWindow):
         self.add(vbox)
 
         self.connect("destroy", app._exit, None)
+
+
+class CueListView(Gtk.ScrolledWindow):
+    """Cues of main playback
+
+    Attributes:
+        liststore (Gtk.ListStore): cue number, delay, up and down times
+        treeview (Gtk.TreeView): cues view
+    """
+
+    def __init__(self):
+        Gtk.ScrolledWindow.__init__(self)
+        self.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        self.liststore = Gtk.ListStore(str, str, str, str)
+        self.treeview = Gtk.TreeView(model=self.liststore)
+        self.treeview.set_grid_lines(Gtk.TreeViewGridLines.BOTH)
+        for i, column_title in enumerate([_("Cue"), _("Delay"), _("Up"), _("Down")]):
+            renderer = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(column_title, renderer, text=i)
+            self.treeview.append_column(column)
+        self.add(self.treeview)
+        self.update_view()
+
+    def update_view(self):
+        """Display cues and select current one"""
+        self.liststore.clear()
+        for cue in App().cue_list.cues:
+            self.liststore.append(
+                [f"{cue.number:g}", f"{cue.delay:g}", f"{cue.up:g}", f"{cue.down:g}"]
+            )
+        position = App().cue_list.position
+        if position >= 0:
+            path = Gtk.TreePath.new_from_indices([position])
+            self.treeview.set_cursor(path, None, False)
+
+
+class SubmastersView(Gtk.Box):
+    """Submasters faders
+
+    Attributes:
+        faders (list): one Gtk.Scale per submaster
+        buttons (list): one inhibitive Gtk.ToggleButton per submaster
+    """
+
+    def __init__(self):
+        Gtk.Box.__init__(self, orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.faders = []
+        self.buttons = []
+        for index in range(SUBMASTERS):
+            box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+            box.pack_start(Gtk.Label(f"Sub {index + 1}"), False, False, 0)
+            fader = Gtk.Scale.new_with_range(Gtk.Orientation.VERTICAL, 0, 255, 1)
+            fader.set_inverted(True)
+            fader.set_digits(0)
+            fader.set_size_request(-1, 200)
+            fader.connect("value-changed", self.fader_moved, index)
+            box.pack_start(fader, True, True, 0)
+            self.faders.append(fader)
+            button = Gtk.ToggleButton(_("Inhibitive"))
+            button.connect("toggled", self.mode_toggled, index)
+            box.pack_start(button, False, False, 0)
+            self.buttons.append(button)
+            self.pack_start(box, False, False, 0)
+
+    def update_view(self):
+        """Display levels and modes of submasters"""
+        for fader, button, submaster in zip(
+            self.faders, self.buttons, App().submasters.bank
+        ):
+            fader.set_value(submaster.level)
+            button.set_active(submaster.inhibitive)
+
+    def fader_moved(self, fader, index):
+        """Submaster fader moved
+
+        Args:
+            fader (Gtk.Scale): fader
+            index (int): submaster index
+        """
+        App().submasters.set_level(index, fader.get_value())
+
+    def mode_toggled(self, button, index):
+        """Submaster mode changed
+
+        Args:
+            button (Gtk.ToggleButton): inhibitive button
+            index (int): submaster index
+        """
+        App().submasters.set_inhibitive(index, button.get_active())